@@ -1,6 +1,11 @@
+from . import controllers
 from . import models
 from . import expressions
 from . import fields
 from . import geo_convertion_helper
 from . import geo_operators
-from .geo_db import init_postgis
+from . import geo_projection
+from . import geo_search_cache
+from .geo_db import init_postgis, register_geometry_adapter
+
+register_geometry_adapter()
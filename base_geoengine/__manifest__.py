@@ -12,6 +12,7 @@
     "depends": ["base", "web"],
     "data": [
         "security/data.xml",
+        "data/ir_cron.xml",
         "views/base_geoengine_view.xml",
         "views/ir_model_view.xml",
         "views/ir_view_view.xml",
@@ -30,7 +31,9 @@
             ("include", "web._assets_bootstrap"),
         ]
     },
-    "external_dependencies": {"python": ["shapely", "geojson", "simplejson"]},
+    "external_dependencies": {
+        "python": ["shapely>=2", "numpy", "geojson", "simplejson"]
+    },
     "installable": True,
     "pre_init_hook": "init_postgis",
 }
@@ -0,0 +1,51 @@
+# Copyright 2023 ACSONE SA/NV
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+import json
+
+from werkzeug.exceptions import NotFound
+
+from odoo import http
+from odoo.http import request
+
+
+class GeoengineController(http.Controller):
+    @http.route(
+        "/geoengine/tiles/<string:model>/<string:field>/<int:z>/<int:x>/<int:y>.pbf",
+        type="http",
+        auth="user",
+        methods=["GET"],
+    )
+    def tile(self, model, field, z, x, y, layer_id=None, domain=None, **kwargs):
+        """Serve the Mapbox Vector Tile z/x/y of a geo field. With a vector
+        layer, its model domain is applied and the value of its attribute
+        field is added to the features. The domain may be given as JSON, it
+        replaces the one of the layer"""
+        if model not in request.env or field not in request.env[model]._fields:
+            raise NotFound()
+        if isinstance(domain, str):
+            domain = json.loads(domain)
+        if layer_id:
+            layer = request.env["geoengine.vector.layer"].browse(int(layer_id)).exists()
+            if not layer or (layer.geo_field_id.model, layer.geo_field_id.name) != (
+                model,
+                field,
+            ):
+                raise NotFound()
+            if layer.use_tile_cache:
+                tile = request.env["geoengine.tile.cache"].get_tile(
+                    layer, z, x, y, domain=domain
+                )
+            else:
+                tile = request.env[model].geo_tile(
+                    field,
+                    z,
+                    x,
+                    y,
+                    domain=layer._get_tile_domain() if domain is None else domain,
+                    attribute_field_name=layer.attribute_field_id.name or None,
+                )
+        else:
+            tile = request.env[model].geo_tile(field, z, x, y, domain=domain)
+        return request.make_response(
+            tile, headers=[("Content-Type", "application/vnd.mapbox-vector-tile")]
+        )
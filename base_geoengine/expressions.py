@@ -1,17 +1,17 @@
 # Copyright 2023 ACSONE SA/NV
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-import random
-import string
+import hashlib
 
 from odoo.osv import expression
 from odoo.osv.expression import TERM_OPERATORS
 from odoo.tools import Query
 
 from .fields import GeoField
-from .geo_operators import GeoOperator
+from .geo_operators import SUBDIVIDE_MAX_VERTICES, GeoOperator
 
 original__leaf_to_sql = expression.expression._expression__leaf_to_sql
+original_parse = expression.expression.parse
 
 GEO_OPERATORS = {
     "geo_greater": ">",
@@ -21,6 +21,7 @@ GEO_OPERATORS = {
     "geo_within": "ST_Within",
     "geo_contains": "ST_Contains",
     "geo_intersect": "ST_Intersects",
+    "geo_dwithin": "ST_DWithin",
 }
 term_operators_list = list(TERM_OPERATORS)
 for op in GEO_OPERATORS:
@@ -38,9 +39,22 @@ def __leaf_to_sql(self, leaf, model, alias):
 
     if isinstance(leaf, (list, tuple)):
         current_field = model._fields.get(left)
-        current_operator = GeoOperator(current_field)
         if current_field and isinstance(current_field, GeoField):
+            current_operator = GeoOperator(
+                current_field,
+                subdivide_max_vertices=int(
+                    model.env["ir.config_parameter"]
+                    .sudo()
+                    .get_param(
+                        "base_geoengine.subdivide_max_vertices", SUBDIVIDE_MAX_VERTICES
+                    )
+                ),
+                tolerance=model._get_geo_simplify_tolerance(current_field),
+            )
             params = []
+            distance = None
+            if operator == "geo_dwithin":
+                right, distance = GeoOperator.parse_dwithin_value(right)
             if isinstance(right, dict):
                 # We are having indirect geo_operator like (‘geom’, ‘geo_...’,
                 # {‘res.zip.poly’: [‘id’, ‘in’, [1,2,3]] })
@@ -53,32 +67,41 @@ def __leaf_to_sql(self, leaf, model, alias):
                     rel_model = model.env[rel_model]
                     # we compute the attributes search on spatial rel
                     if ref_search[key]:
-                        rel_alias = (
-                            rel_model._table
-                            + "_"
-                            + "".join(random.choices(string.ascii_lowercase, k=5))
-                        )
+                        rel_alias = get_rel_alias(alias, left, rel_model._table)
                         rel_query = where_calc(
                             rel_model,
                             ref_search[key],
                             active_test=True,
                             alias=rel_alias,
                         )
-                        model._apply_ir_rules(rel_query, "read")
+                        apply_ir_rules(rel_model, rel_query, rel_alias)
+                        left_sql = f'"{alias}"."{left}"'
+                        right_sql = f'"{rel_alias}"."{rel_col}"'
                         if operator == "geo_equal":
                             rel_query.add_where(
-                                f'"{alias}"."{left}" {GEO_OPERATORS[operator]} '
-                                f"{rel_alias}.{rel_col}"
+                                current_operator.get_geo_equal_join_sql(
+                                    left_sql, right_sql
+                                )
                             )
                         elif operator in ("geo_greater", "geo_lesser"):
                             rel_query.add_where(
-                                f"ST_Area({alias}.{left}) {GEO_OPERATORS[operator]} "
-                                f"ST_Area({rel_alias}.{rel_col})"
+                                "{} {} {}".format(
+                                    current_field.companion_sql(alias, "area"),
+                                    GEO_OPERATORS[operator],
+                                    rel_model._fields[rel_col].companion_sql(
+                                        rel_alias, "area"
+                                    ),
+                                )
+                            )
+                        elif operator == "geo_dwithin":
+                            rel_query.add_where(
+                                *current_operator.get_geo_dwithin_join_sql(
+                                    left_sql, right_sql, distance
+                                )
                             )
                         else:
                             rel_query.add_where(
-                                f'{GEO_OPERATORS[operator]}("{alias}"."{left}", '
-                                f"{rel_alias}.{rel_col})"
+                                f"{GEO_OPERATORS[operator]}({left_sql}, {right_sql})"
                             )
 
                         subquery, subparams = rel_query.subselect("1")
@@ -87,13 +110,107 @@ def __leaf_to_sql(self, leaf, model, alias):
                 query = " AND ".join(sub_queries)
             else:
                 query = get_geo_func(
-                    current_operator, operator, left, right, params, model._table
+                    current_operator,
+                    operator,
+                    left,
+                    right,
+                    params,
+                    alias,
+                    distance=distance,
                 )
             return query, params
         return original__leaf_to_sql(self, leaf=leaf, model=model, alias=alias)
 
 
-def get_geo_func(current_operator, operator, left, right, params, table):
+def parse(self):
+    """
+    This method has been monkey patched in order to resolve the geo
+    operators on dotted paths (‘partner_id.geo_point’, ‘geo_...’, ...)
+    before the domain is parsed.
+    """
+    self.expression = [
+        resolved
+        for element in self.expression
+        for resolved in resolve_geo_path(element, self.root_model)
+    ]
+    return original_parse(self)
+
+
+def resolve_geo_path(element, model):
+    """Rewrite a geo leaf on a path through a relational field into
+    domain elements on that field matching the sub-query of the related
+    records. The whole search is done by a single SQL query and the geo
+    leaf on the related table uses its index, longer paths are resolved
+    recursively by the search on the related model. Returns a list of
+    domain elements."""
+    if not isinstance(element, (list, tuple)) or len(element) != 3:
+        return [element]
+    left, operator, right = element
+    if operator not in GEO_OPERATORS or "." not in left:
+        return [element]
+    fname, path = left.split(".", 1)
+    field = model._fields.get(fname)
+    if not field or not field.store or not field.relational:
+        return [element]
+    comodel = model.env[field.comodel_name]
+    domain = [(path, operator, right)]
+    if field.type == "many2one":
+        comodel = comodel.with_context(active_test=False)
+    else:
+        comodel = comodel.with_context(**field.context)
+        domain += field.get_domain_list(model)
+    comodel_query = comodel._search(domain, order="id")
+    if field.type == "many2one":
+        # the null test keeps the negation of the leaf true for empty values
+        return [
+            "&",
+            (fname, "!=", False),
+            (fname, "inselect", comodel_query.subselect()),
+        ]
+    if field.type == "one2many":
+        return [
+            (
+                "id",
+                "inselect",
+                comodel_query.subselect(f'"{comodel._table}"."{field.inverse_name}"'),
+            )
+        ]
+    subquery, params = comodel_query.subselect()
+    return [
+        (
+            "id",
+            "inselect",
+            (
+                f'SELECT "{field.relation}"."{field.column1}" FROM "{field.relation}" '
+                f'WHERE "{field.relation}"."{field.column2}" IN ({subquery})',
+                params,
+            ),
+        )
+    ]
+
+
+def get_rel_alias(alias, left, rel_table):
+    """Return the alias of the table of an indirect geo search. It only
+    depends on the leaf, so the same domain always gives the same SQL and
+    the plans of the queries can be reused."""
+    rel_alias = f"{alias}__{left}__{rel_table}"
+    if len(rel_alias) > 63:
+        digest = hashlib.sha1(rel_alias.encode()).hexdigest()[:8]
+        rel_alias = f"{rel_alias[:54]}_{digest}"
+    return rel_alias
+
+
+def apply_ir_rules(model, query, alias):
+    """Apply the read record rules of model to its query aliased by alias,
+    as _apply_ir_rules does for the table of the model"""
+    if model.env.su:
+        return
+    rule_domain = model.env["ir.rule"]._compute_domain(model._name, "read")
+    if rule_domain:
+        expression.expression(rule_domain, model.sudo(), alias=alias, query=query)
+
+
+def get_geo_func(current_operator, operator, left, right, params, table, distance=None):
     """
     This method will call the SQL query corresponding to the requested geo operator
     """
@@ -112,6 +229,10 @@ def get_geo_func(current_operator, operator, left, right, params, table):
             query = current_operator.get_geo_contains_sql(table, left, right, params)
         case "geo_intersect":
             query = current_operator.get_geo_intersect_sql(table, left, right, params)
+        case "geo_dwithin":
+            query = current_operator.get_geo_dwithin_sql(
+                table, left, right, params, distance
+            )
         case _:
             raise NotImplementedError(f"The operator {operator} is not supported")
     return query
@@ -136,3 +257,4 @@ def where_calc(model, domain, active_test=True, alias=None):
 
 
 expression.expression._expression__leaf_to_sql = __leaf_to_sql
+expression.expression.parse = parse
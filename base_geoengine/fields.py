@@ -2,24 +2,30 @@
 # Copyright 2016 Yannick Payot (Camptocamp SA)
 # Copyright 2023 ACSONE SA/NV
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
-import json
 import logging
 from operator import attrgetter
 
 from odoo import _, fields
 from odoo.tools import sql
 
-from . import geo_convertion_helper as convert
-from .geo_db import create_geo_column
+from . import geo_convertion_helper as convert, geo_projection
+from .geo_db import (
+    GEO_COMPANIONS,
+    companion_column_name,
+    create_geo_column,
+    create_geo_companion_column,
+    create_geo_simplified_column,
+    simplified_column_name,
+)
 
 logger = logging.getLogger(__name__)
 try:
-    import geojson
-    from shapely.geometry import Point, shape
+    import numpy as np
+    import shapely
     from shapely.geometry.base import BaseGeometry
     from shapely.wkb import loads as wkbloads
 except ImportError:
-    logger.warning("Shapely or geojson are not available in the sys path")
+    logger.warning("Shapely is not available in the sys path")
 
 
 class GeoField(fields.Field):
@@ -27,47 +33,69 @@ class GeoField(fields.Field):
     specialized fields for geolocalization. Subclasses must define a type
     and a geo_type. The type is the name of the corresponding column type,
     the geo_type is the name of the corresponding type in the GIS system.
+
+    geo_precision is the number of decimals of the coordinates returned by
+    read, it can be overridden with the geo_precision context key.
+
+    geo_write_wkt sends the geometries to the database as EWKT text instead
+    of binary EWKB. It is a field attribute because the values written are
+    converted when they are flushed, without the context of the writer.
+
+    geo_companions lists values derived from the geometry that are stored
+    and indexed in their own column, kept up to date by the database:
+    "bbox" (envelope), "label_point" (point on surface) and "area".
+
+    geo_simplify_levels lists tolerances, in the unit of the srid, of
+    simplified copies of the geometry stored and indexed in their own column.
+    Reads, vector tiles and geo searches for a coarse map resolution use the
+    most simplified copy within the tolerance of the resolution.
     """
 
     geo_type = None
     dim = 2
     srid = 3857
     gist_index = True
+    geo_precision = None
+    geo_companions = ()
+    geo_simplify_levels = ()
+    geo_write_wkt = False
 
     @property
     def column_type(self):
         return ("geometry", f"geometry({self.geo_type.upper()}, {self.srid})")
 
-    def convert_to_column(self, value, record, values=None):
+    def convert_to_column(self, value, record, values=None, validate=True):
         """Convert value to database format
 
         value can be geojson, wkt, shapely geometry object.
-        If geo_direct_write in context you can pass diretly WKT"""
+        The geometry is sent to the database as binary EWKB, unless the
+        field sets geo_write_wkt in which case EWKT text is used."""
         if not value:
             return None
         shape_to_write = self.entry_to_shape(value, same_type=True)
         if shape_to_write.is_empty:
             return None
-        else:
+        elif self.geo_write_wkt:
             return f"SRID={self.srid};{shape_to_write.wkt}"
+        else:
+            return shapely.set_srid(shape_to_write, self.srid)
 
     def convert_to_cache(self, value, record, validate=True):
-        val = value
-        if isinstance(val, (bytes, str)):
-            try:
-                int(val, 16)
-            except Exception:
-                # not an hex value -> try to load from a sting
-                # representation of a geometry
-                value = convert.value_to_shape(value, use_wkb=False)
-        if isinstance(value, BaseGeometry):
-            val = value.wkb_hex
-        return val
+        """Geometries are kept in cache as raw WKB bytes"""
+        if not value:
+            return value
+        value_format = convert.sniff_format(value)
+        if value_format == convert.WKB:
+            return bytes(value)
+        if value_format == convert.HEX_WKB and isinstance(value, str):
+            return bytes.fromhex(value)
+        # a string representation of a geometry or a geometry object
+        return convert.value_to_shape(value).wkb
 
     def convert_to_record(self, value, record):
         """Value may be:
         - a GeoJSON string when field onchange is triggered
-        - a geometry object hexcode from cache
+        - a geometry object WKB bytes from cache
         - a unicode containing dict
         """
         if not value:
@@ -76,13 +104,13 @@ class GeoField(fields.Field):
 
     def convert_to_read(self, value, record, use_name_get=True):
         if not isinstance(value, BaseGeometry):
-            # read hexadecimal value from database
+            # read WKB value from database
             shape = self.load_geo(value)
         else:
             shape = value
         if not shape or shape.is_empty:
             return False
-        return geojson.dumps(shape)
+        return convert.shapes_to_geojson([shape])[0]
 
     #
     # Field description
@@ -98,7 +126,11 @@ class GeoField(fields.Field):
         """Load geometry into browse record after read was done"""
         if isinstance(wkb, BaseGeometry):
             return wkb
-        return wkbloads(wkb, hex=True) if wkb else False
+        if not wkb:
+            return False
+        if isinstance(wkb, str):
+            return wkbloads(wkb, hex=True)
+        return wkbloads(bytes(wkb))
 
     def entry_to_shape(self, value, same_type=False):
         """Transform input into an object"""
@@ -113,6 +145,58 @@ class GeoField(fields.Field):
                 raise TypeError(msg)
         return shape
 
+    def entry_to_ewkb(self, value):
+        """Return the geometry of value as EWKB in the srid of the field"""
+        shape = shapely.set_srid(self.entry_to_shape(value), self.srid)
+        return shapely.to_wkb(shape, include_srid=True)
+
+    def entry_to_sql_literal(self, value):
+        """Return the geometry of value in the srid of the field as a SQL
+        literal. It only contains hexadecimal digits (EWKB), so it can be
+        inlined in clauses that do not take parameters like ORDER BY"""
+        return "'{}'::geometry".format(self.entry_to_ewkb(value).hex())
+
+    def companion_sql(self, alias, companion):
+        """Return the SQL expression of a companion value of the field for
+        the given table alias, read from its column when it is stored"""
+        column_type, expression, index_method = GEO_COMPANIONS[companion]
+        if companion in self.geo_companions:
+            return '"{}"."{}"'.format(
+                alias, companion_column_name(self.name, companion)
+            )
+        return expression.replace('"{column}"', '"{}"."{}"'.format(alias, self.name))
+
+    def simplified_level(self, tolerance):
+        """Return the largest stored simplification tolerance that does not
+        exceed tolerance, or None"""
+        if not tolerance or not self.store:
+            return None
+        return max(
+            (level for level in self.geo_simplify_levels if level <= tolerance),
+            default=None,
+        )
+
+    def simplified_sql(self, alias, tolerance):
+        """Return the SQL expression of the geometries of the field for the
+        given table alias, read from the most simplified copy stored for
+        tolerance if any"""
+        level = self.simplified_level(tolerance)
+        if level is None:
+            return '"{}"."{}"'.format(alias, self.name)
+        return '"{}"."{}"'.format(alias, simplified_column_name(self.name, level))
+
+    def update_db(self, model, columns):
+        res = super().update_db(model, columns)
+        for companion in self.geo_companions:
+            create_geo_companion_column(
+                model._cr, model._table, self.name, companion, self.srid
+            )
+        for level in self.geo_simplify_levels:
+            create_geo_simplified_column(
+                model._cr, model._table, self.name, level, self.srid
+            )
+        return res
+
     def update_geo_db_column(self, model):
         """Update the column type in the database."""
         cr = model._cr
@@ -226,23 +310,8 @@ class GeoLine(GeoField):
         :param srid: SRID
         :return: LINESTRING Object
         """
-        sql = """
-        SELECT
-            ST_MakeLine(
-                ST_GeomFromText(%(wkt1)s, %(srid)s),
-                ST_GeomFromText(%(wkt2)s, %(srid)s)
-            )
-        """
-        cr.execute(
-            sql,
-            {
-                "wkt1": point1.wkt,
-                "wkt2": point2.wkt,
-                "srid": srid or cls.srid,
-            },
-        )
-        res = cr.fetchone()
-        return cls.load_geo(res[0])
+        line = shapely.linestrings([point1.coords[0], point2.coords[0]])
+        return shapely.set_srid(line, srid or cls.srid)
 
 
 class GeoPoint(GeoField):
@@ -254,49 +323,42 @@ class GeoPoint(GeoField):
     @classmethod
     def from_latlon(cls, cr, latitude, longitude):
         """Convert a (latitude, longitude) into an UTM coordinate Point:"""
-        pt = Point(longitude, latitude)
-        cr.execute(
-            """
-            SELECT
-                ST_Transform(
-                    ST_GeomFromText(%(wkt)s, 4326),
-                    %(srid)s)
-        """,
-            {"wkt": pt.wkt, "srid": cls.srid},
-        )
-        res = cr.fetchone()
-        return cls.load_geo(res[0])
+        return cls.from_latlon_many(cr, [latitude], [longitude])[0]
 
     @classmethod
     def to_latlon(cls, cr, geopoint):
         """Convert a UTM coordinate point to (latitude, longitude):"""
-        # Line to execute to retrieve longitude, latitude  from UTM in postgres command line:
-        #  SELECT ST_X(geom), ST_Y(geom) FROM (SELECT ST_TRANSFORM(ST_SetSRID(
-        #               ST_MakePoint(601179.61612, 6399375,681364), 900913), 4326) as geom) g;
-        if isinstance(geopoint, BaseGeometry):
-            geo_point_instance = geopoint
-        else:
-            geo_point_instance = shape(json.loads(geopoint))
-        cr.execute(
-            """
-                    SELECT
-                        ST_TRANSFORM(
-                            ST_SetSRID(
-                                ST_MakePoint(
-                                        %(coord_x)s, %(coord_y)s
-                                            ),
-                                        %(srid)s
-                                      ), 4326)""",
-            {
-                "coord_x": geo_point_instance.x,
-                "coord_y": geo_point_instance.y,
-                "srid": cls.srid,
-            },
+        longitudes, latitudes = cls.to_latlon_many(cr, [geopoint])
+        return float(longitudes[0]), float(latitudes[0])
+
+    @classmethod
+    def from_latlon_many(cls, cr, latitudes, longitudes, srid=None):
+        """Convert arrays of latitudes and longitudes into an array of Points.
+
+        Spherical mercator coordinates are computed locally, see
+        geo_projection for the other srids.
+        """
+        srid = srid or cls.srid
+        xs, ys = geo_projection.transform_coordinates(
+            cr, longitudes, latitudes, convert.WGS84_SRID, srid
         )
+        return shapely.points(xs, ys)
+
+    @classmethod
+    def to_latlon_many(cls, cr, geopoints, srid=None):
+        """Convert a sequence of Points into arrays of longitudes and latitudes.
 
-        res = cr.fetchone()
-        point_latlon = cls.load_geo(res[0])
-        return point_latlon.x, point_latlon.y
+        Points may be given in any format accepted by the field. Spherical
+        mercator coordinates are computed locally, see geo_projection for
+        the other srids.
+        """
+        srid = srid or cls.srid
+        points = np.asarray(
+            [convert.value_to_shape(geopoint) for geopoint in geopoints], dtype=object
+        )
+        return geo_projection.transform_coordinates(
+            cr, shapely.get_x(points), shapely.get_y(points), srid, convert.WGS84_SRID
+        )
 
 
 class GeoPolygon(GeoField):
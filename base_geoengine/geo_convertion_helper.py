@@ -1,42 +1,184 @@
 # Copyright 2011-2012 Nicolas Bessi (Camptocamp SA)
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+import json
 import logging
 
 from odoo import _
 
 try:
-    import geojson
-    from shapely import wkb, wkt
+    import numpy as np
+    import shapely
     from shapely.geometry import shape
     from shapely.geometry.base import BaseGeometry
 except ImportError:
     logger = logging.getLogger(__name__)
-    logger.warning(_("Shapely or geojson are not available in the sys path"))
+    logger.warning(_("Shapely is not available in the sys path"))
+
+# Input formats recognized by sniff_format
+SHAPE = "shape"
+WKB = "wkb"
+HEX_WKB = "hex_wkb"
+EWKT = "ewkt"
+WKT = "wkt"
+GEOJSON = "geojson"
+GEOJSON_DICT = "geojson_dict"
+GEO_INTERFACE = "geo_interface"
+TEXT_FORMATS = (HEX_WKB, EWKT, WKT, GEOJSON)
+
+# number of leading characters looked at to detect the format of a string
+SNIFF_LENGTH = 32
+
+WGS84_SRID = 4326
+WEB_MERCATOR_SRID = 3857
+# radius of the sphere used by the spherical mercator projection
+EARTH_RADIUS = 6378137.0
+
+
+def sniff_format(value):
+    """Return the format of a geometry value.
+
+    Only the type of the value and a few of its leading bytes or characters
+    are inspected, so the cost does not depend on the size of the geometry.
+    Returns None if the format is not recognized."""
+    if isinstance(value, BaseGeometry):
+        return SHAPE
+    if isinstance(value, dict):
+        return GEOJSON_DICT
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        # the first byte of a WKB is its byte order, 0 or 1
+        head = bytes(value[:SNIFF_LENGTH])
+        if head[:1] in (b"\x00", b"\x01"):
+            return WKB
+        value = head.decode("ascii", errors="replace")
+    if isinstance(value, str):
+        head = value[:SNIFF_LENGTH].lstrip() or value.lstrip()[:SNIFF_LENGTH]
+        if head[:1] == "{":
+            return GEOJSON
+        if head[:2] in ("00", "01"):
+            return HEX_WKB
+        if head[:5].upper() == "SRID=":
+            return EWKT
+        if head[:1].isalpha():
+            return WKT
+        return None
+    if hasattr(value, "__geo_interface__"):
+        return GEO_INTERFACE
+    return None
+
+
+def _from_ewkt(value):
+    srid, geometry = value.split(";", 1)
+    return shapely.set_srid(shapely.from_wkt(geometry), int(srid.strip()[5:]))
+
+
+PARSERS = {
+    SHAPE: lambda value: value,
+    WKB: lambda value: shapely.from_wkb(bytes(value)),
+    HEX_WKB: shapely.from_wkb,
+    EWKT: _from_ewkt,
+    WKT: shapely.from_wkt,
+    GEOJSON: shapely.from_geojson,
+    GEOJSON_DICT: lambda value: shapely.from_geojson(json.dumps(value)),
+    GEO_INTERFACE: shape,
+}
 
 
 def value_to_shape(value, use_wkb=False):
-    """Transforms input into a Shapely object"""
+    """Transforms input into a Shapely object
+
+    The format of the value is detected by sniff_format and the value is
+    handed to the matching Shapely parser. use_wkb is kept for backward
+    compatibility, WKB values are recognized without it."""
     if not value:
-        return wkt.loads("GEOMETRYCOLLECTION EMPTY")
-    if isinstance(value, str):
-        # We try to do this before parsing json exception
-        # exception are ressource costly
-        if "{" in value:
-            geo_dict = geojson.loads(value)
-            return shape(geo_dict)
-        elif use_wkb:
-            return wkb.loads(value, hex=True)
-        else:
-            return wkt.loads(value)
-    elif hasattr(value, "wkt"):
-        if isinstance(value, BaseGeometry):
-            return value
-        else:
-            return wkt.loads(value.wkt)
-    else:
+        return shapely.from_wkt("GEOMETRYCOLLECTION EMPTY")
+    value_format = sniff_format(value)
+    if value_format is None and hasattr(value, "wkt"):
+        value, value_format = value.wkt, WKT
+    if value_format is None:
         raise TypeError(
             _(
-                "Write/create/search geo type must be wkt/geojson "
+                "Write/create/search geo type must be wkt/wkb/geojson "
                 "string or must respond to wkt"
             )
         )
+    if value_format in TEXT_FORMATS and not isinstance(value, str):
+        value = bytes(value).decode()
+    return PARSERS[value_format](value)
+
+
+def values_to_shapes(values):
+    """Transforms a sequence of WKB values (hex strings or bytes) into
+    a numpy array of Shapely objects using a single vectorized call.
+    Empty values are returned as None"""
+    values = np.asarray(
+        [
+            (value.tobytes() if isinstance(value, memoryview) else value) or None
+            for value in values
+        ],
+        dtype=object,
+    )
+    return shapely.from_wkb(values)
+
+
+def shapes_to_geojson(geometries, precision=None):
+    """Serializes a sequence of Shapely objects into GeoJSON strings using
+    a single vectorized call. Coordinates are rounded to precision decimals
+    if given. Missing and empty geometries are returned as False"""
+    geometries = np.asarray(geometries, dtype=object)
+    if precision is not None:
+        geometries = shapely.transform(
+            geometries, lambda coords: coords.round(precision)
+        )
+    result = shapely.to_geojson(geometries)
+    result[shapely.is_missing(geometries) | shapely.is_empty(geometries)] = False
+    return result.tolist()
+
+
+def shapes_to_hex_ewkb(geometries, srid):
+    """Serializes a sequence of Shapely objects into hexadecimal EWKB
+    strings with the given srid using a single vectorized call. Missing
+    geometries are returned as None"""
+    geometries = shapely.set_srid(np.asarray(geometries, dtype=object), srid)
+    return shapely.to_wkb(geometries, hex=True, include_srid=True).tolist()
+
+
+def subdivide(geometry, max_vertices, max_depth=32):
+    """Split a Shapely object into pieces of at most max_vertices vertices,
+    the way ST_Subdivide does: the geometry is clipped by the two halves of
+    its bounding box, along its longest side, until the pieces are small
+    enough. The union of the pieces is the geometry. The halves are
+    intersected with the geometry, unlike clip_by_rect the result is valid.
+    Returns a list of Shapely objects"""
+    if max_depth <= 0 or shapely.get_num_coordinates(geometry) <= max_vertices:
+        return [geometry]
+    minx, miny, maxx, maxy = geometry.bounds
+    if maxx - minx >= maxy - miny:
+        middle = (minx + maxx) / 2
+        halves = ((minx, miny, middle, maxy), (middle, miny, maxx, maxy))
+    else:
+        middle = (miny + maxy) / 2
+        halves = ((minx, miny, maxx, middle), (minx, middle, maxx, maxy))
+    pieces = []
+    for half in halves:
+        piece = shapely.intersection(geometry, shapely.box(*half))
+        if not piece.is_empty:
+            pieces += subdivide(piece, max_vertices, max_depth - 1)
+    return pieces
+
+
+def lonlat_to_mercator(longitudes, latitudes):
+    """Project arrays of WGS84 longitudes and latitudes to spherical
+    mercator (EPSG:3857) coordinates"""
+    xs = EARTH_RADIUS * np.radians(longitudes)
+    ys = EARTH_RADIUS * np.log(np.tan(np.pi / 4 + np.radians(latitudes) / 2))
+    return xs, ys
+
+
+def mercator_to_lonlat(xs, ys):
+    """Unproject arrays of spherical mercator (EPSG:3857) coordinates to
+    WGS84 longitudes and latitudes"""
+    longitudes = np.degrees(np.asarray(xs, dtype=float) / EARTH_RADIUS)
+    latitudes = np.degrees(
+        2 * np.arctan(np.exp(np.asarray(ys, dtype=float) / EARTH_RADIUS)) - np.pi / 2
+    )
+    return longitudes, latitudes
@@ -10,6 +10,13 @@ from odoo.tools import sql
 logger = logging.getLogger("geoengine.sql")
 _schema = logging.getLogger("odoo.schema")
 
+try:
+    import shapely
+    from psycopg2.extensions import Binary, new_type, register_adapter, register_type
+    from shapely.geometry.base import BaseGeometry
+except ImportError:
+    logger.warning("Shapely is not available in the sys path")
+
 
 def init_postgis(cr):
     """Initialize postgis
@@ -74,6 +81,90 @@ def create_geo_column(cr, tablename, columnname, geotype, srid, dim, comment=Non
     )
 
 
+# Values derived from a geometry column that can be stored next to it:
+# name -> (column type, expression, index method)
+GEO_COMPANIONS = {
+    "bbox": ("geometry(Geometry, {srid})", 'ST_Envelope("{column}")', "GIST"),
+    "label_point": ("geometry(Point, {srid})", 'ST_PointOnSurface("{column}")', "GIST"),
+    "area": ("double precision", 'ST_Area("{column}")', "BTREE"),
+}
+
+
+def companion_column_name(columnname, companion):
+    return "{}_{}".format(columnname, companion)
+
+
+def create_geo_companion_column(cr, tablename, columnname, companion, srid):
+    """Create and index a column storing a value derived from a geometry
+    column unless it exists. It is a generated column, so PostgreSQL keeps
+    it up to date on every write.
+
+    :params: companion: one of the keys of GEO_COMPANIONS
+    """
+    column_type, expression, index_method = GEO_COMPANIONS[companion]
+    companion_name = companion_column_name(columnname, companion)
+    if not sql.column_exists(cr, tablename, companion_name):
+        # pylint: disable=E8103
+        cr.execute(
+            'ALTER TABLE "{}" ADD COLUMN "{}" {} GENERATED ALWAYS AS ({}) STORED'.format(
+                tablename,
+                companion_name,
+                column_type.format(srid=srid),
+                expression.format(column=columnname),
+            )
+        )
+        _schema.debug(
+            "Table %r: added %s column %r", tablename, companion, companion_name
+        )
+    indexname = "{}_{}_index".format(tablename, companion_name)
+    if sql.index_exists(cr, indexname):
+        return
+    # pylint: disable=E8103
+    cr.execute(
+        'CREATE INDEX "{}" ON "{}" USING {} ("{}")'.format(
+            indexname, tablename, index_method, companion_name
+        )
+    )
+    _schema.debug("Table %r: created index %r", tablename, indexname)
+
+
+def simplified_column_name(columnname, tolerance):
+    """Return the name of the column storing the geometries of a column
+    simplified with tolerance, e.g. the_geom_simplified_0_001"""
+    suffix = format(tolerance, "g").replace(".", "_").replace("-", "m")
+    return "{}_simplified_{}".format(columnname, suffix.replace("+", ""))
+
+
+def create_geo_simplified_column(cr, tablename, columnname, tolerance, srid):
+    """Create and index a column storing the geometries of a column
+    simplified with tolerance unless it exists. Like the companions, it is
+    a generated column: PostgreSQL simplifies the geometry of the rows that
+    are written, the other rows are left as is.
+    """
+    simplified_name = simplified_column_name(columnname, tolerance)
+    if not sql.column_exists(cr, tablename, simplified_name):
+        # pylint: disable=E8103
+        cr.execute(
+            'ALTER TABLE "{}" ADD COLUMN "{}" geometry(Geometry, {}) GENERATED '
+            'ALWAYS AS (ST_SimplifyPreserveTopology("{}", {!r})) STORED'.format(
+                tablename, simplified_name, int(srid), columnname, float(tolerance)
+            )
+        )
+        _schema.debug(
+            "Table %r: added simplified column %r", tablename, simplified_name
+        )
+    indexname = "{}_{}_index".format(tablename, simplified_name)
+    if sql.index_exists(cr, indexname):
+        return
+    # pylint: disable=E8103
+    cr.execute(
+        'CREATE INDEX "{}" ON "{}" USING GIST ("{}")'.format(
+            indexname, tablename, simplified_name
+        )
+    )
+    _schema.debug("Table %r: created index %r", tablename, indexname)
+
+
 def _postgis_index_name(table, col_name):
     return "{}_{}_gist_index".format(table, col_name)
 
@@ -90,3 +181,65 @@ def create_geo_index(cr, columnname, tablename):
         )
     )
     _schema.debug("Table %r: created index %r", tablename, indexname)
+
+
+class GeometryAdapter(object):
+    """Adapt Shapely geometries to SQL as a binary EWKB parameter.
+
+    The SRID embedded in the geometry (see ``shapely.set_srid``) is sent
+    along, so the value can be written as is into a geometry column.
+    """
+
+    def __init__(self, geometry):
+        self.wkb = Binary(shapely.to_wkb(geometry, include_srid=True))
+
+    def prepare(self, conn):
+        self.wkb.prepare(conn)
+
+    def getquoted(self):
+        return b"ST_GeomFromEWKB(%s)" % self.wkb.getquoted()
+
+
+def register_geometry_adapter():
+    """Let psycopg2 pass Shapely geometries as query parameters"""
+    register_adapter(BaseGeometry, GeometryAdapter)
+
+
+# database name -> typecaster of the geometry type in the database
+_geometry_typecasters = {}
+
+
+def _cast_geometry(value, cursor):
+    """Decode the hex EWKB output of PostGIS into raw bytes"""
+    if value is None:
+        return None
+    return bytes.fromhex(value)
+
+
+def register_geometry_typecaster(cr, refresh=False):
+    """Receive geometry values as raw EWKB bytes instead of hex strings on
+    the connection of cr.
+
+    The geometry type is created by the postgis extension, so its oid
+    depends on the database and has to be looked up. The typecaster is
+    registered on the connection, which is bound to the database, as the
+    oid may be another type in the other databases of the server. The oid
+    is looked up again with refresh, when the registry is loaded.
+    """
+    typecaster = None if refresh else _geometry_typecasters.get(cr.dbname)
+    if typecaster is None:
+        cr.execute("SELECT oid FROM pg_type WHERE typname = 'geometry'")
+        oids = tuple(oid for oid, in cr.fetchall())
+        if not oids:
+            return
+        typecaster = new_type(oids, "GEOMETRY", _cast_geometry)
+        _geometry_typecasters[cr.dbname] = typecaster
+    connection = cr._cnx
+    if all(oid in connection.string_types for oid in typecaster.values):
+        return
+    register_type(typecaster, connection)
+    logger.debug(
+        "Registered geometry typecaster for oids %s of %s",
+        typecaster.values,
+        cr.dbname,
+    )
@@ -1,30 +1,158 @@
 # Copyright 2011-2012 Nicolas Bessi (Camptocamp SA)
 # Copyright 2023 ACSONE SA/NV
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+import math
+
+from odoo import _
+
+from .geo_convertion_helper import WGS84_SRID, subdivide
+
+# lower bound of the length in meters of a degree of latitude, and of a
+# degree of longitude at the equator, used to turn a distance into a
+# search box that contains all the matches
+MIN_METERS_PER_DEGREE = 110000.0
+# latitude above which a search box covers all longitudes
+POLAR_LATITUDE = 89.0
+# query geometries with more vertices are split by geo_intersect and
+# geo_within, overridden by the base_geoengine.subdivide_max_vertices
+# system parameter (0 disables the subdivision)
+SUBDIVIDE_MAX_VERTICES = 256
 
 
 class GeoOperator(object):
-    def __init__(self, geo_field):
+    def __init__(
+        self, geo_field, subdivide_max_vertices=SUBDIVIDE_MAX_VERTICES, tolerance=None
+    ):
         self.geo_field = geo_field
+        self.subdivide_max_vertices = subdivide_max_vertices
+        # the geometries are compared with their most simplified copy
+        # stored for tolerance, see GeoField.geo_simplify_levels
+        self.tolerance = tolerance
+
+    @staticmethod
+    def parse_dwithin_value(value):
+        """Return the (geometry, distance) of the value of a geo_dwithin
+        leaf, the geometry may be the dict of an indirect search"""
+        if not isinstance(value, (list, tuple)) or len(value) != 2:
+            raise ValueError(
+                _("The value of geo_dwithin must be a pair (geometry, distance)")
+            )
+        geometry, distance = value
+        return geometry, float(distance)
+
+    @staticmethod
+    def _get_degree_box_deltas(miny, maxy, distance):
+        """Return the (dx, dy) in degrees to expand a WGS84 box by so that
+        it contains every point at less than distance meters from it"""
+        dy = distance / MIN_METERS_PER_DEGREE
+        latitude = max(abs(miny), abs(maxy)) + dy
+        if latitude >= POLAR_LATITUDE:
+            return 360.0, dy
+        return distance / (MIN_METERS_PER_DEGREE * math.cos(math.radians(latitude))), dy
+
+    def _get_column_sql(self, table, col):
+        return self.geo_field.simplified_sql(table, self.tolerance)
+
+    def _get_geometry_sql(self, value, params):
+        """Add the geometry of value to params as EWKB with the srid of the
+        field and return the SQL reading it"""
+        params.append(self.geo_field.entry_to_ewkb(value))
+        return "ST_GeomFromEWKB(%s)"
 
     def _get_direct_como_op_sql(self, table, col, value, params, op=""):
-        """provide raw sql for geater and lesser operators"""
+        """provide raw sql for geater and lesser operators
+
+        The area of the column is read from its companion column when the
+        field stores it and the area of a given geometry is computed locally
+        """
         if isinstance(value, (int, float)):
-            return " ST_Area({}.{}) {} {}".format(table, col, op, value)
+            params.append(value)
         else:
             base = self.geo_field.entry_to_shape(value, same_type=False)
-            params.append(base.wkt)
-            return " ST_Area({}.{}) {} ST_Area(ST_GeomFromText(%s))".format(
-                table, col, op
-            )
+            params.append(base.area)
+        return "{} {} %s".format(self.geo_field.companion_sql(table, "area"), op)
 
     def _get_postgis_comp_sql(self, table, col, value, params, op=""):
-        """return raw sql for all search based on St_**(a, b) posgis operator"""
+        """return raw sql for all search based on St_**(a, b) posgis operator,
+        they use the GiST index of the column by themselves"""
+        column = self._get_column_sql(table, col)
+        geometry = self._get_geometry_sql(value, params)
+        return f"{op}({column}, {geometry})"
+
+    def _get_subdivided_sql(self, table, col, base, params):
+        """Return raw sql matching the rows intersecting one of the pieces
+        of base split by subdivide, or None if base is small enough.
+
+        The rows are first filtered with the bounding box of base, which
+        uses the GiST index, then tested against the pieces whose
+        bounding box they overlap: each test only involves a few vertices
+        instead of the whole geometry. The pieces are decoded once per
+        query (ARRAY sub-query).
+        """
+        max_vertices = self.subdivide_max_vertices
+        if not max_vertices or base.is_empty:
+            return None
+        pieces = subdivide(base, max_vertices)
+        if len(pieces) == 1:
+            return None
+        column = self._get_column_sql(table, col)
+        params += [*base.bounds, self.geo_field.srid]
+        params.append([self.geo_field.entry_to_ewkb(piece) for piece in pieces])
+        return (
+            f"({column} && ST_MakeEnvelope(%s, %s, %s, %s, %s) AND EXISTS ("
+            "SELECT 1 FROM unnest(ARRAY("
+            "SELECT ST_GeomFromEWKB(ewkb) FROM unnest(%s::bytea[]) AS u(ewkb)"
+            f")) AS piece(geom) WHERE {column} && piece.geom "
+            f"AND ST_Intersects({column}, piece.geom)))"
+        )
+
+    def get_geo_dwithin_sql(self, table, col, value, params, distance):
+        """Returns raw sql for geo_dwithin operator
+        (records at less than distance of the geometry)
+
+        The distance is in meters for fields in WGS84, which are compared as
+        geographies behind a bounding box filter using the GiST index, and
+        in the units of the srid of the field otherwise.
+        """
+        column = self._get_column_sql(table, col)
+        if self.geo_field.srid != WGS84_SRID:
+            geometry = self._get_geometry_sql(value, params)
+            params.append(distance)
+            return f"ST_DWithin({column}, {geometry}, %s)"
         base = self.geo_field.entry_to_shape(value, same_type=False)
-        srid = self.geo_field.srid
-        params.append(base.wkt)
-        params.append(srid)
-        return f"{op}({table}.{col}, ST_GeomFromText(%s, %s))"
+        minx, miny, maxx, maxy = base.bounds
+        dx, dy = self._get_degree_box_deltas(miny, maxy, distance)
+        params += [minx - dx, miny - dy, maxx + dx, maxy + dy, WGS84_SRID]
+        geometry = self._get_geometry_sql(base, params)
+        params.append(distance)
+        return (
+            f"({column} && ST_MakeEnvelope(%s, %s, %s, %s, %s) AND "
+            f"ST_DWithin({column}::geography, {geometry}::geography, %s))"
+        )
+
+    def get_geo_dwithin_join_sql(self, left, right, distance):
+        """Return the raw sql and params of geo_dwithin between the geo
+        columns left and right of two tables (indirect search)"""
+        if self.geo_field.srid != WGS84_SRID:
+            return f"ST_DWithin({left}, {right}, %s)", [distance]
+        # same bounding box filter as get_geo_dwithin_sql computed by
+        # PostgreSQL for each geometry of the right table
+        dy = distance / MIN_METERS_PER_DEGREE
+        latitude = f"greatest(abs(ST_YMin({right})), abs(ST_YMax({right}))) + %s"
+        dx = (
+            f"CASE WHEN {latitude} >= {POLAR_LATITUDE} THEN 360.0 "
+            f"ELSE %s / ({MIN_METERS_PER_DEGREE} * cos(radians({latitude}))) END"
+        )
+        return (
+            f"({left} && ST_Expand({right}, {dx}, %s) AND "
+            f"ST_DWithin({left}::geography, {right}::geography, %s))"
+        ), [dy, distance, dy, dy, distance]
+
+    def get_geo_equal_join_sql(self, left, right):
+        """Return the raw sql of geo_equal between the geo columns left and
+        right of two tables (indirect search), the = operator does not use
+        the GiST index so the bounding boxes are compared first"""
+        return f"({left} && {right} AND {left} = {right})"
 
     def get_geo_greater_sql(self, table, col, value, params):
         """Returns raw sql for geo_greater operator
@@ -45,18 +173,23 @@ class GeoOperator(object):
         params,
     ):
         """Returns raw sql for geo_equal operator
-        (used for equality comparison)
+        (used for equality comparison), the simplified copies are not
+        equal to the geometry so the column itself is compared
         """
-        base = self.geo_field.entry_to_shape(value, same_type=False)
-        compare_to = "ST_GeomFromText(%s)"
-        params.append(base.wkt)
-        return " {}.{} = {}".format(table, col, compare_to)
+        column = f'"{table}"."{col}"'
+        bbox = self._get_geometry_sql(value, params)
+        geometry = self._get_geometry_sql(value, params)
+        return f"({column} && {bbox} AND {column} = {geometry})"
 
     def get_geo_intersect_sql(self, table, col, value, params):
         """Returns raw sql for geo_intersec operator
         (used for spatial comparison)
         """
-        return self._get_postgis_comp_sql(table, col, value, params, op="ST_Intersects")
+        base = self.geo_field.entry_to_shape(value, same_type=False)
+        subdivided = self._get_subdivided_sql(table, col, base, params)
+        if subdivided:
+            return subdivided
+        return self._get_postgis_comp_sql(table, col, base, params, op="ST_Intersects")
 
     def get_geo_touch_sql(self, table, col, value, params):
         """Returns raw sql for geo_touch operator
@@ -67,8 +200,17 @@ class GeoOperator(object):
     def get_geo_within_sql(self, table, col, value, params):
         """Returns raw sql for geo_within operator
         (used for spatial comparison)
+
+        A row within a complex geometry intersects one of its pieces, they
+        are tested first so that the whole geometry is only involved for
+        the candidate rows.
         """
-        return self._get_postgis_comp_sql(table, col, value, params, op="ST_Within")
+        base = self.geo_field.entry_to_shape(value, same_type=False)
+        subdivided = self._get_subdivided_sql(table, col, base, params)
+        within = self._get_postgis_comp_sql(table, col, base, params, op="ST_Within")
+        if subdivided:
+            return f"({subdivided} AND {within})"
+        return within
 
     def get_geo_contains_sql(self, table, col, value, params):
         """Returns raw sql for geo_contains operator
@@ -0,0 +1,170 @@
+# Copyright 2023 ACSONE SA/NV
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+"""In-process reprojection of coordinates and geometries.
+
+Spatial reference systems are read from the spatial_ref_sys table of the
+database once and the transformers built from them are kept in a LRU cache,
+so moving data between two SRIDs does not need a query. The spherical
+mercator (3857) <-> WGS84 (4326) conversion is computed with NumPy, other
+conversions use pyproj when it is installed and fall back to a single
+ST_Transform query otherwise.
+"""
+import functools
+import logging
+
+from odoo import _
+
+from . import geo_convertion_helper as convert
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+    import shapely
+except ImportError:
+    logger.warning("Shapely is not available in the sys path")
+
+try:
+    import pyproj
+except ImportError:
+    pyproj = None
+
+TRANSFORMER_CACHE_SIZE = 64
+
+# (dbname, srid) -> definition of the spatial reference system
+_srs_definitions = {}
+
+
+def parse_srid(srid):
+    """Return the SRID as an integer, srid may be given as 3857 or as an
+    authority string like "EPSG:3857" (the format of the view projection)"""
+    if isinstance(srid, str):
+        srid = srid.rsplit(":", 1)[-1]
+    return int(srid)
+
+
+def get_srs_definition(cr, srid):
+    """Return the definition of a SRID as found in spatial_ref_sys"""
+    key = (cr.dbname, srid)
+    if key not in _srs_definitions:
+        cr.execute(
+            """
+            SELECT auth_name, auth_srid, srtext, proj4text
+            FROM spatial_ref_sys
+            WHERE srid = %s
+            """,
+            (srid,),
+        )
+        row = cr.fetchone()
+        if not row:
+            raise ValueError(_("Unknown SRID %s") % srid)
+        auth_name, auth_srid, srtext, proj4text = row
+        if auth_name and auth_srid:
+            _srs_definitions[key] = f"{auth_name}:{auth_srid}"
+        else:
+            _srs_definitions[key] = srtext or proj4text
+    return _srs_definitions[key]
+
+
+class MercatorTransformer(object):
+    """Exact spherical mercator projection of WGS84 coordinates"""
+
+    def __init__(self, inverse=False):
+        self.inverse = inverse
+
+    def transform(self, xs, ys):
+        if self.inverse:
+            return convert.mercator_to_lonlat(xs, ys)
+        return convert.lonlat_to_mercator(xs, ys)
+
+
+class PyprojTransformer(object):
+    """Transformation between two spatial reference systems by pyproj"""
+
+    def __init__(self, source_definition, target_definition):
+        self.transformer = pyproj.Transformer.from_crs(
+            source_definition, target_definition, always_xy=True
+        )
+
+    def transform(self, xs, ys):
+        return self.transformer.transform(
+            np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)
+        )
+
+
+@functools.lru_cache(maxsize=TRANSFORMER_CACHE_SIZE)
+def _get_transformer(source_definition, target_definition):
+    if pyproj is None:
+        return None
+    return PyprojTransformer(source_definition, target_definition)
+
+
+def get_transformer(cr, source_srid, target_srid):
+    """Return the transformer from source_srid to target_srid, or None if
+    the transformation has to be done by PostGIS"""
+    if (source_srid, target_srid) == (convert.WGS84_SRID, convert.WEB_MERCATOR_SRID):
+        return MercatorTransformer()
+    if (source_srid, target_srid) == (convert.WEB_MERCATOR_SRID, convert.WGS84_SRID):
+        return MercatorTransformer(inverse=True)
+    # transformers are cached by definition as SRIDs are only unique
+    # within a database
+    return _get_transformer(
+        get_srs_definition(cr, source_srid), get_srs_definition(cr, target_srid)
+    )
+
+
+def _postgis_transform_coordinates(cr, xs, ys, source_srid, target_srid):
+    """Transform arrays of coordinates with a single ST_Transform query"""
+    cr.execute(
+        """
+        SELECT ST_X(geom), ST_Y(geom)
+        FROM (
+            SELECT
+                seq,
+                ST_Transform(
+                    ST_SetSRID(ST_MakePoint(x, y), %(source_srid)s), %(target_srid)s
+                ) AS geom
+            FROM unnest(%(xs)s::float8[], %(ys)s::float8[])
+                WITH ORDINALITY AS u(x, y, seq)
+        ) points
+        ORDER BY seq
+        """,
+        {
+            "xs": np.asarray(xs, dtype=float).tolist(),
+            "ys": np.asarray(ys, dtype=float).tolist(),
+            "source_srid": source_srid,
+            "target_srid": target_srid,
+        },
+    )
+    coordinates = np.array(cr.fetchall(), dtype=float).reshape(-1, 2)
+    return coordinates[:, 0], coordinates[:, 1]
+
+
+def transform_coordinates(cr, xs, ys, source_srid, target_srid):
+    """Transform arrays of x and y coordinates from source_srid to
+    target_srid and return the transformed arrays"""
+    source_srid, target_srid = parse_srid(source_srid), parse_srid(target_srid)
+    xs, ys = np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)
+    if source_srid == target_srid:
+        return xs, ys
+    transformer = get_transformer(cr, source_srid, target_srid)
+    if transformer is None:
+        return _postgis_transform_coordinates(cr, xs, ys, source_srid, target_srid)
+    return transformer.transform(xs, ys)
+
+
+def transform_geometries(cr, geometries, source_srid, target_srid):
+    """Transform a sequence of Shapely objects from source_srid to
+    target_srid, the coordinates of all the geometries are transformed at
+    once. Return a numpy array of Shapely objects"""
+    target_srid = parse_srid(target_srid)
+    geometries = np.asarray(geometries, dtype=object)
+
+    def _transform(coordinates):
+        xs, ys = transform_coordinates(
+            cr, coordinates[:, 0], coordinates[:, 1], source_srid, target_srid
+        )
+        return np.column_stack([xs, ys])
+
+    geometries = shapely.transform(geometries, _transform)
+    return shapely.set_srid(geometries, target_srid)
@@ -0,0 +1,225 @@
+# Copyright 2023 ACSONE SA/NV
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+"""Cache of the results of geo searches.
+
+Models opt in with ``_geo_search_cache = True``. The results of their
+searches with a geo operator are kept in a LRU cache per registry, keyed by
+the normalized domain (with the geometries hashed), the search parameters
+and what the record rules depend on. Each result depends on the tables of
+the models it was searched on.
+
+The cache only holds results read from committed data. A transaction that
+changed a model keeps the results of the searches depending on it for
+itself, and signals the change when it is committed: the entries depending
+on the table are dropped and the signaling sequence of the table is
+incremented. The other workers read the signaling sequences once per
+transaction and drop the entries of the tables whose sequence changed.
+"""
+import hashlib
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+
+from odoo import models
+
+_logger = logging.getLogger(__name__)
+
+try:
+    from shapely.geometry.base import BaseGeometry
+except ImportError:
+    _logger.warning("Shapely is not available in the sys path")
+
+# number of searches kept in the cache of a registry
+GEO_SEARCH_CACHE_MAX_ENTRIES = 1024
+# memory cap of the cache of a registry, in number of cached record ids
+GEO_SEARCH_CACHE_MAX_IDS = 1000000
+# strings longer than this (WKT, GeoJSON) are hashed in the keys
+HASH_MIN_LENGTH = 64
+# prefix of the signaling sequences of the tables
+SIGNALING_PREFIX = "geo_search_cache_"
+MAX_IDENTIFIER_LENGTH = 63
+
+_caches = weakref.WeakKeyDictionary()
+_caches_lock = threading.Lock()
+
+
+class Unhashable(Exception):
+    """Raised by freeze for values that can not be part of a key"""
+
+
+def _digest(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def freeze(value):
+    """Return a hashable version of a domain or a domain value, the
+    geometries being replaced by a hash of their WKB"""
+    if isinstance(value, BaseGeometry):
+        return ("geometry", _digest(value.wkb))
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return ("bytes", _digest(bytes(value)))
+    if isinstance(value, str) and len(value) > HASH_MIN_LENGTH:
+        return ("str", _digest(value.encode()))
+    if isinstance(value, models.BaseModel):
+        return ("records", value._name, value._ids)
+    if isinstance(value, dict):
+        return ("dict", tuple(sorted((key, freeze(val)) for key, val in value.items())))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(val) for val in value)
+    try:
+        hash(value)
+    except TypeError as error:
+        raise Unhashable() from error
+    return value
+
+
+class GeoSearchCache(object):
+    """LRU cache of search results with a cap on the number of entries and
+    on the number of cached ids. Entries are dropped by table, and when the
+    signaling sequences of their tables change"""
+
+    def __init__(
+        self,
+        max_entries=GEO_SEARCH_CACHE_MAX_ENTRIES,
+        max_ids=GEO_SEARCH_CACHE_MAX_IDS,
+    ):
+        self.max_entries = max_entries
+        self.max_ids = max_ids
+        # key -> (value, tables)
+        self.entries = OrderedDict()
+        self.size = 0
+        # table -> last value of its signaling sequence
+        self.sequences = {}
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def _entry_size(value):
+        return len(value) if isinstance(value, tuple) else 1
+
+    def _check_sequences(self, tables, sequences):
+        """Drop the entries of the tables whose signaling sequence changed
+        and return whether the sequences seen by the transaction are the
+        latest ones for tables"""
+        if sequences is None:
+            return True
+        current = True
+        changed = set()
+        for table in tables:
+            sequence = sequences.get(signaling_sequence(table), 0)
+            known = self.sequences.get(table)
+            if known is None or sequence > known:
+                if known is not None:
+                    changed.add(table)
+                self.sequences[table] = sequence
+            elif sequence < known:
+                current = False
+        if changed:
+            self._drop(changed)
+        return current
+
+    def _drop(self, tables):
+        for key, (value, entry_tables) in list(self.entries.items()):
+            if entry_tables & tables:
+                del self.entries[key]
+                self.size -= self._entry_size(value)
+
+    def get(self, key, tables, sequences=None):
+        with self.lock:
+            if not self._check_sequences(tables, sequences):
+                return None
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, tables, sequences=None):
+        with self.lock:
+            # the result may be older than the cached ones
+            if not self._check_sequences(tables, sequences):
+                return
+            size = self._entry_size(value)
+            if size > self.max_ids:
+                return
+            if key in self.entries:
+                self.size -= self._entry_size(self.entries.pop(key)[0])
+            self.entries[key] = (value, frozenset(tables))
+            self.size += size
+            while len(self.entries) > self.max_entries or self.size > self.max_ids:
+                __, (evicted, __) = self.entries.popitem(last=False)
+                self.size -= self._entry_size(evicted)
+
+    def invalidate(self, tables):
+        """Drop the entries depending on tables"""
+        with self.lock:
+            self._drop(set(tables))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def get_cache(registry):
+    """Return the geo search cache of a registry"""
+    with _caches_lock:
+        cache = _caches.get(registry)
+        if cache is None:
+            cache = _caches[registry] = GeoSearchCache()
+        return cache
+
+
+def signaling_sequence(table):
+    return "{}{}".format(SIGNALING_PREFIX, table)[:MAX_IDENTIFIER_LENGTH]
+
+
+def create_signaling(cr, table):
+    """Create the signaling sequence of a table unless it exists"""
+    # pylint: disable=E8103
+    cr.execute('CREATE SEQUENCE IF NOT EXISTS "{}"'.format(signaling_sequence(table)))
+
+
+def get_transaction_state(cr):
+    """Return the state of the geo search cache for the current transaction
+    of cr: the signaling sequences it saw, the tables it changed and the
+    results of the searches depending on them. It is kept in the data of
+    the postcommit callbacks, which is dropped at the end of the
+    transaction"""
+    data = cr.postcommit.data
+    if "geo_search_cache" not in data:
+        data["geo_search_cache"] = {
+            "sequences": None,
+            "changed": set(),
+            "local": GeoSearchCache(),
+        }
+    return data["geo_search_cache"]
+
+
+def get_sequences(cr):
+    """Return the values of the signaling sequences, read once per
+    transaction"""
+    state = get_transaction_state(cr)
+    if state["sequences"] is None:
+        cr.execute(
+            """
+            SELECT sequencename, coalesce(last_value, 0)
+            FROM pg_sequences
+            WHERE sequencename LIKE %s
+            """,
+            (SIGNALING_PREFIX.replace("_", "\\_") + "%",),
+        )
+        state["sequences"] = dict(cr.fetchall())
+    return state["sequences"]
+
+
+def signal_changes(registry, tables):
+    """Drop the entries depending on tables and signal the change to the
+    other workers, once the transaction that changed them is committed"""
+    get_cache(registry).invalidate(tables)
+    with registry.cursor() as cr:
+        for table in sorted(tables):
+            cr.execute("SELECT nextval(%s)", (signaling_sequence(table),))
@@ -21,5 +21,6 @@
 from . import base
 from . import geo_raster_layer
 from . import geo_vector_layer
+from . import geo_tile_cache
 from . import ir_view
 from . import ir_model
@@ -2,20 +2,72 @@
 # Copyright 2016 Yannick Payot (Camptocamp SA)
 # Copyright 2023 ACSONE SA/NV
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+import functools
 import logging
+import math
 
 from odoo import _, api, models
 from odoo.exceptions import MissingError, UserError
-from odoo.osv.expression import AND
+from odoo.models import regex_field_agg
+from odoo.osv.expression import AND, normalize_domain
 
-from .. import fields as geo_fields
+from .. import (
+    fields as geo_fields,
+    geo_convertion_helper as convert,
+    geo_db,
+    geo_projection,
+    geo_search_cache,
+)
+from ..expressions import GEO_OPERATORS
 
 DEFAULT_EXTENT = (
     "-123164.85222423, 5574694.9538936, " "1578017.6490538, 6186191.1800898"
 )
+# predicates of the operators supported by geo_join
+GEO_JOIN_OPERATORS = {
+    "geo_intersect": "ST_Intersects",
+    "geo_touch": "ST_Touches",
+    "geo_within": "ST_Within",
+    "geo_contains": "ST_Contains",
+}
+GEO_AGGREGATE_FUNCTIONS = ("sum", "count", "avg", "min", "max")
+# aggregate functions of geo fields in read_group -> SQL aggregate
+GEO_READ_GROUP_AGGREGATES = {
+    "extent": "ST_Extent({column})",
+    "union": "ST_Union({column})",
+    "collect": "ST_Collect({column})",
+    # the centroid of the collected geometries is computed by GEOS, as
+    # ST_Centroid does
+    "centroid": "ST_Collect({column})",
+    "count_in": "count(*) FILTER (WHERE NOT ST_IsEmpty({column}))",
+}
+# maxdecimaldigits given to ST_AsGeoJSON to keep the full precision
+POSTGIS_MAX_DECIMAL_DIGITS = 15
+# number of rows of a table from which geo searches are counted from the
+# estimate of the query planner, see geo_search_count
+APPROXIMATE_COUNT_THRESHOLD = 100000
+# size of the Mapbox Vector Tiles in tile coordinates and of the buffer
+# around them, the geometries crossing the tile borders are clipped there
+MVT_EXTENT = 4096
+MVT_BUFFER = 64
+MVT_MAX_ZOOM = 30
+# width of the spherical mercator world, the extent of the zoom level 0 tile
+MVT_WORLD_SIZE = 2 * math.pi * convert.EARTH_RADIUS
+# size in pixels of the tiles of the zoom levels given by geo_zoom
+MAP_TILE_SIZE = 256
+# length of a degree of longitude at the equator, in meters
+METERS_PER_DEGREE = MVT_WORLD_SIZE / 360
+# geometries read for a map resolution are simplified to this part of a pixel
+SIMPLIFY_PIXEL_TOLERANCE = 0.5
 
 _logger = logging.getLogger(__name__)
 
+try:
+    import numpy as np
+    import shapely
+except ImportError:
+    _logger.warning("Numpy or Shapely is not available in the sys path")
+
 
 class Base(models.AbstractModel):
     """Extend Base class for to allow definition of geo fields."""
@@ -24,6 +76,15 @@ class Base(models.AbstractModel):
 
     # Array of ash that define layer and data to use
     _georepr = []
+    # cache the results of the searches with geo operators on the model,
+    # see geo_search_cache
+    _geo_search_cache = False
+
+    def _auto_init(self):
+        res = super()._auto_init()
+        if self._geo_search_cache:
+            geo_search_cache.create_signaling(self.env.cr, self._table)
+        return res
 
     @api.model
     def fields_get(self, allfields=None, attributes=None):
@@ -47,6 +108,365 @@ class Base(models.AbstractModel):
                 res[f_name]["geo_type"] = geo_type
         return res
 
+    @api.model
+    def search(self, args, offset=0, limit=None, order=None, count=False):
+        """Return the result of geo searches from the geo search cache when
+        the model uses it"""
+        key = self._geo_search_cache_key(args, offset, limit, order, count)
+        if key is None:
+            return super().search(
+                args, offset=offset, limit=limit, order=order, count=count
+            )
+        self.check_access_rights("read")
+        tables = set(key[1])
+        state = geo_search_cache.get_transaction_state(self.env.cr)
+        if state["changed"] & tables:
+            # the result depends on changes of the transaction, it is only
+            # cached for the transaction
+            cache, sequences = state["local"], None
+        else:
+            cache = geo_search_cache.get_cache(self.env.registry)
+            sequences = geo_search_cache.get_sequences(self.env.cr)
+        result = cache.get(key, tables, sequences)
+        if result is None:
+            records = super().search(
+                args, offset=offset, limit=limit, order=order, count=count
+            )
+            cache.put(key, records if count else records._ids, tables, sequences)
+            return records
+        return result if count else self.browse(result)
+
+    def _geo_search_cache_key(self, domain, offset, limit, order, count):
+        """Return the key of a search in the geo search cache, or None if the
+        search can not be cached: the model does not use the cache, there
+        is no geo operator, or the result depends on other models that do
+        not use it"""
+        if not self._geo_search_cache:
+            return None
+        domain = normalize_domain(domain or [])
+        model_names = {self._name}
+        has_geo_leaf = False
+        for element in domain:
+            if not isinstance(element, (list, tuple)):
+                continue
+            left, operator, right = element
+            if "." in str(left):
+                return None
+            if operator not in GEO_OPERATORS:
+                continue
+            has_geo_leaf = True
+            if operator == "geo_dwithin" and isinstance(right, (list, tuple)):
+                right = right[0]
+            if isinstance(right, dict):
+                model_names.update(key.rsplit(".", 1)[0] for key in right)
+        if not has_geo_leaf or not all(
+            self.env[model_name]._geo_search_cache for model_name in model_names
+        ):
+            return None
+        context = self.env.context
+        try:
+            return (
+                self._name,
+                # the tables the result depends on
+                tuple(sorted(self.env[name]._table for name in model_names)),
+                geo_search_cache.freeze(domain),
+                offset,
+                limit,
+                order,
+                count,
+                self.env.uid,
+                self.env.su,
+                context.get("lang"),
+                tuple(context.get("allowed_company_ids") or ()),
+                context.get("active_test", True),
+                geo_search_cache.freeze(context.get("geo_distance_from")),
+                # the geometries may be compared with a simplified copy
+                tuple(
+                    context.get(key)
+                    for key in (
+                        "geo_simplify_tolerance",
+                        "geo_resolution",
+                        "geo_resolution_srid",
+                        "geo_zoom",
+                    )
+                ),
+            )
+        except geo_search_cache.Unhashable:
+            return None
+
+    def _geo_search_cache_invalidate(self):
+        """Drop the results of the transaction depending on the model, the
+        geo search caches of the workers are invalidated when the
+        transaction is committed"""
+        state = geo_search_cache.get_transaction_state(self.env.cr)
+        state["local"].invalidate({self._table})
+        if not state["changed"]:
+            self.env.cr.postcommit.add(
+                functools.partial(
+                    geo_search_cache.signal_changes,
+                    self.env.registry,
+                    state["changed"],
+                )
+            )
+        state["changed"].add(self._table)
+
+    def _geo_tile_cache_fields(self):
+        """Return the geo fields of the model whose vector tiles are cached"""
+        if "geoengine.vector.layer" not in self.env:
+            return ()
+        layers = self.env["geoengine.vector.layer"]
+        return layers._get_tile_cache_fields().get(self._name, ())
+
+    def _geo_tile_cache_invalidate(self, field_names):
+        """Drop the cached vector tiles crossed by the geometries of the
+        records"""
+        self.flush_recordset(list(field_names))
+        self.env["geoengine.tile.cache"]._invalidate_records(self, field_names)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        if self._geo_search_cache:
+            self._geo_search_cache_invalidate()
+        tile_cache_fields = self._geo_tile_cache_fields()
+        if tile_cache_fields:
+            records._geo_tile_cache_invalidate(tile_cache_fields)
+        return records
+
+    def write(self, vals):
+        res = super().write(vals)
+        if self._geo_search_cache:
+            self._geo_search_cache_invalidate()
+        return res
+
+    def _write(self, vals):
+        """Drop the cached vector tiles of the old geometries before they
+        are updated and the ones of the new geometries after. The
+        geometries are written by _write when they are flushed, whether
+        they were given to write or computed"""
+        field_names = [name for name in self._geo_tile_cache_fields() if name in vals]
+        if field_names:
+            self.env["geoengine.tile.cache"]._invalidate_records(self, field_names)
+        res = super()._write(vals)
+        if field_names:
+            self.env["geoengine.tile.cache"]._invalidate_records(self, field_names)
+        return res
+
+    def unlink(self):
+        tile_cache_fields = self._geo_tile_cache_fields()
+        if tile_cache_fields:
+            self._geo_tile_cache_invalidate(tile_cache_fields)
+        res = super().unlink()
+        if self._geo_search_cache:
+            self._geo_search_cache_invalidate()
+        return res
+
+    def read(self, fields=None, load="_classic_read"):
+        """Serialize the geo fields of the whole batch at once"""
+        fields = self.check_field_access_rights("read", fields)
+        geo_fnames = [
+            fname
+            for fname in fields
+            if isinstance(self._fields[fname], geo_fields.GeoField)
+        ]
+        if not geo_fnames:
+            return super().read(fields, load=load)
+        other_fnames = [fname for fname in fields if fname not in geo_fnames]
+        result = super().read(other_fnames or ["id"], load=load)
+        records = self.browse([vals["id"] for vals in result])
+        for fname in geo_fnames:
+            for vals, value in zip(result, records._geo_read_geojson(fname)):
+                vals[fname] = value
+        return result
+
+    def _read(self, field_names):
+        """Fetch the geometries as raw EWKB bytes, the typecaster is
+        registered on the connections of the database as they are used"""
+        if any(
+            isinstance(self._fields[name], geo_fields.GeoField) for name in field_names
+        ):
+            geo_db.register_geometry_typecaster(self.env.cr)
+        return super()._read(field_names)
+
+    def _geo_cache_values(self, field_name):
+        """Return the cached values (WKB) of a geo field for the recordset,
+        fetching or computing the missing ones in batch"""
+        field = self._fields[field_name]
+        cache = self.env.cache
+        missing = self.filtered(lambda rec: not cache.contains(rec, field))
+        if missing:
+            if field.store:
+                missing._read([field_name])
+            else:
+                missing.mapped(field_name)
+        return [cache.get(rec, field, None) for rec in self]
+
+    def _geo_read_geojson(self, field_name):
+        """Return the GeoJSON representation of a geo field for the recordset.
+
+        All the geometries are serialized in one vectorized call, with the
+        precision of the field or the one given by geo_precision in context.
+        They are simplified when the context gives a tolerance or a map
+        resolution, see _get_geo_simplify_tolerance, and read by PostGIS from
+        a simplified copy when the field stores one for the tolerance.
+        """
+        field = self._get_geo_field(field_name)
+        precision = self.env.context.get("geo_precision", field.geo_precision)
+        tolerance = self._get_geo_simplify_tolerance(field)
+        if tolerance and precision is None:
+            # the coordinates are not more precise than the tolerance
+            precision = max(0, -math.floor(math.log10(tolerance)))
+        level = field.simplified_level(tolerance)
+        if (
+            field.store
+            and all(self._ids)
+            and (self.env.context.get("geo_read_postgis") or level is not None)
+        ):
+            return self._geo_read_postgis_geojson(field_name, precision, tolerance)
+        geometries = convert.values_to_shapes(self._geo_cache_values(field_name))
+        if tolerance:
+            geometries = shapely.simplify(geometries, tolerance, preserve_topology=True)
+        return convert.shapes_to_geojson(geometries, precision)
+
+    @api.model
+    def _get_geo_simplify_tolerance(self, field):
+        """Return the tolerance the geometries of field are simplified with
+        when read, in the unit of its SRID, or None. The tolerance is given
+        by the geo_simplify_tolerance context key or derived from the
+        resolution of the map: geo_resolution, in map units per pixel of the
+        geo_resolution_srid SRID (3857 by default), or geo_zoom, a zoom level
+        of the spherical mercator tiles"""
+        context = self.env.context
+        if context.get("geo_simplify_tolerance"):
+            return float(context["geo_simplify_tolerance"])
+        resolution = context.get("geo_resolution")
+        srid = context.get("geo_resolution_srid") or convert.WEB_MERCATOR_SRID
+        if not resolution and context.get("geo_zoom") is not None:
+            resolution = (
+                MVT_WORLD_SIZE / MAP_TILE_SIZE / 2 ** float(context["geo_zoom"])
+            )
+            srid = convert.WEB_MERCATOR_SRID
+        if not resolution:
+            return None
+        resolution = float(resolution)
+        srid = geo_projection.parse_srid(srid)
+        # other SRIDs than WGS84 are assumed to be in meters
+        if srid == convert.WGS84_SRID and field.srid != convert.WGS84_SRID:
+            resolution *= METERS_PER_DEGREE
+        elif srid != convert.WGS84_SRID and field.srid == convert.WGS84_SRID:
+            resolution /= METERS_PER_DEGREE
+        return resolution * SIMPLIFY_PIXEL_TOLERANCE
+
+    @api.model
+    def _read_group_raw(
+        self,
+        domain,
+        fields,
+        groupby,
+        offset=0,
+        limit=None,
+        orderby=False,
+        lazy=True,
+    ):
+        """Add the aggregates of geo fields (the_geom:extent, :union,
+        :collect, :centroid and :count_in, the number of non-empty
+        geometries). Geometries are returned as GeoJSON like in read,
+        extents as [xmin, ymin, xmax, ymax]."""
+        geo_aggregates = {}
+        other_fields = []
+        for fspec in fields:
+            match = regex_field_agg.match(fspec)
+            name, func, fname = match.groups() if match else (None, None, None)
+            field = self._fields.get(fname or name)
+            if func in GEO_READ_GROUP_AGGREGATES and isinstance(
+                field, geo_fields.GeoField
+            ):
+                geo_aggregates[name] = (func, field)
+            else:
+                other_fields.append(fspec)
+        result = super()._read_group_raw(
+            domain,
+            other_fields or ["__count"],
+            groupby,
+            offset=offset,
+            limit=limit,
+            orderby=orderby,
+            lazy=lazy,
+        )
+        if not geo_aggregates or not result:
+            return result
+        rows = self._read_group_geo_aggregates(
+            [group["__domain"] for group in result], geo_aggregates
+        )
+        for index, (name, (func, field)) in enumerate(geo_aggregates.items()):
+            values = [row[index] for row in rows]
+            if func == "extent":
+                values = [
+                    [float(v) for v in value[4:-1].replace(",", " ").split()]
+                    if value
+                    else False
+                    for value in values
+                ]
+            elif func != "count_in":
+                geometries = convert.values_to_shapes(values)
+                if func == "centroid":
+                    geometries = shapely.centroid(geometries)
+                precision = self.env.context.get("geo_precision", field.geo_precision)
+                values = convert.shapes_to_geojson(geometries, precision)
+            for group, value in zip(result, values):
+                group[name] = value
+        return result
+
+    @api.model
+    def _read_group_geo_aggregates(self, domains, geo_aggregates):
+        """Return a row of the geo aggregates for each group domain, they are
+        computed by a single query"""
+        self.flush_model([field.name for func, field in geo_aggregates.values()])
+        geo_db.register_geometry_typecaster(self.env.cr)
+        selects = []
+        params = []
+        for index, domain in enumerate(domains):
+            query = self._where_calc(domain)
+            self._apply_ir_rules(query, "read")
+            columns = [str(index)]
+            for func, field in geo_aggregates.values():
+                column = self._inherits_join_calc(self._table, field.name, query)
+                columns.append(GEO_READ_GROUP_AGGREGATES[func].format(column=column))
+            query_str, query_params = query.select(*columns)
+            selects.append(f"({query_str})")
+            params += query_params
+        self.env.cr.execute(" UNION ALL ".join(selects), params)
+        rows = {row[0]: row[1:] for row in self.env.cr.fetchall()}
+        return [rows[index] for index in range(len(domains))]
+
+    def _geo_read_postgis_geojson(self, field_name, precision=None, tolerance=None):
+        """Return the GeoJSON representation of a stored geo field as
+        produced by PostGIS, without decoding the geometries in Python. The
+        geometries are simplified with tolerance if given, starting from the
+        most simplified copy stored for it"""
+        field = self._get_geo_field(field_name)
+        self.flush_recordset([field_name])
+        geometry = field.simplified_sql(self._table, tolerance)
+        params = []
+        if tolerance and tolerance != field.simplified_level(tolerance):
+            geometry = f"ST_SimplifyPreserveTopology({geometry}, %s)"
+            params.append(tolerance)
+        params += [
+            POSTGIS_MAX_DECIMAL_DIGITS if precision is None else precision,
+            list(self.ids),
+        ]
+        # pylint: disable=E8103
+        self.env.cr.execute(
+            f"""
+            SELECT id, ST_AsGeoJSON({geometry}, %s, 0)
+            FROM "{self._table}"
+            WHERE id = ANY(%s) AND NOT ST_IsEmpty("{field_name}")
+            """,
+            params,
+        )
+        geojson_by_id = dict(self.env.cr.fetchall())
+        return [geojson_by_id.get(id_, False) for id_ in self.ids]
+
     @api.model
     def _get_geo_view(self):
         IrView = self.env["ir.ui.view"]
@@ -108,11 +528,7 @@ class Base(models.AbstractModel):
     def get_edit_info_for_geo_column(self, column):
         raster_obj = self.env["geoengine.raster.layer"]
 
-        field = self._fields.get(column)
-        if not field or not isinstance(field, geo_fields.GeoField):
-            raise ValueError(
-                _("%s column does not exists or is not a geo field") % column
-            )
+        field = self._get_geo_field(column)
         view = self._get_geo_view()
         raster = raster_obj.search(
             [("view_id", "=", view.id), ("use_to_edit", "=", True)], limit=1
@@ -130,6 +546,593 @@ class Base(models.AbstractModel):
             "default_zoom": view.default_zoom,
         }
 
+    def _get_geo_field(self, field_name):
+        field = self._fields.get(field_name)
+        if not field or not isinstance(field, geo_fields.GeoField):
+            raise ValueError(
+                _("%s column does not exists or is not a geo field") % field_name
+            )
+        return field
+
+    def geo_array(self, field_name, srid=None):
+        """Return the geometries of a geo field for the whole recordset.
+
+        The column is fetched in one query and decoded with a single
+        vectorized call, which is the fast path for bulk analytics and
+        computes over large recordsets.
+
+        :param field_name: name of a stored geo field
+        :param srid: if given, the geometries are reprojected to this srid
+                     (e.g. the projection of a geoengine view)
+        :return: a tuple ``(ids, geometries)`` of numpy arrays in the order
+                 of the recordset, missing geometries are ``None``
+        """
+        field = self._get_geo_field(field_name)
+        if not field.store:
+            raise ValueError(_("%s is not a stored geo field") % field_name)
+        self.check_access_rights("read")
+        self.check_field_access_rights("read", [field_name])
+        self.check_access_rule("read")
+        if not self:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=object)
+        self.flush_recordset([field_name])
+        # pylint: disable=E8103
+        self.env.cr.execute(
+            f"""
+            SELECT t.id, t."{field_name}"
+            FROM unnest(%s::integer[]) WITH ORDINALITY AS u(id, seq)
+            JOIN "{self._table}" t ON t.id = u.id
+            ORDER BY u.seq
+            """,
+            (list(self.ids),),
+        )
+        rows = self.env.cr.fetchall()
+        ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        geometries = convert.values_to_shapes([row[1] for row in rows])
+        if srid:
+            geometries = geo_projection.transform_geometries(
+                self.env.cr, geometries, field.srid, srid
+            )
+        return ids, geometries
+
+    @api.model
+    def geo_extent(self, field_name, domain=None):
+        """Return the extent of a geo field over the records matching domain
+        as ``[xmin, ymin, xmax, ymax]``, or False if there is no geometry.
+        The stored bounding boxes are aggregated when the field has the bbox
+        companion."""
+        field = self._get_geo_field(field_name)
+        domain = domain or []
+        self.check_access_rights("read")
+        self.check_field_access_rights("read", [field_name])
+        self._flush_search(domain, fields=[field_name])
+        query = self._where_calc(domain)
+        self._apply_ir_rules(query, "read")
+        query_str, params = query.select(
+            "ST_Extent({})".format(field.companion_sql(self._table, "bbox"))
+        )
+        # pylint: disable=E8103
+        self.env.cr.execute(
+            f"""
+            SELECT ST_XMin(extent), ST_YMin(extent), ST_XMax(extent), ST_YMax(extent)
+            FROM ({query_str}) AS geo_extent(extent)
+            WHERE extent IS NOT NULL
+            """,
+            params,
+        )
+        row = self.env.cr.fetchone()
+        return list(row) if row else False
+
+    @api.model
+    def geo_tile(self, field_name, z, x, y, domain=None, attribute_field_name=None):
+        """Return the Mapbox Vector Tile z/x/y of the records matching domain
+        as bytes. The features are the geometries of field_name, identified
+        by the record ids, with the value of attribute_field_name as
+        property"""
+        field = self._get_geo_field(field_name)
+        z, x, y = int(z), int(x), int(y)
+        if not (0 <= z <= MVT_MAX_ZOOM and 0 <= x < 2**z and 0 <= y < 2**z):
+            raise ValueError(_("%(z)s/%(x)s/%(y)s is not a valid tile", z=z, x=x, y=y))
+        fields_to_read = [field_name]
+        attribute = None
+        if attribute_field_name:
+            attribute = self._fields.get(attribute_field_name)
+            if (
+                not attribute
+                or not attribute.store
+                or not attribute.column_type
+                or attribute.name == "id"
+            ):
+                raise ValueError(
+                    _("%s column can not be a tile attribute") % attribute_field_name
+                )
+            fields_to_read.append(attribute_field_name)
+        domain = domain or []
+        self.check_access_rights("read")
+        self.check_field_access_rights("read", fields_to_read)
+        self._flush_search(domain, fields=fields_to_read)
+        query = self._where_calc(domain)
+        self._apply_ir_rules(query, "read")
+        column = f'"{self._table}"."{field.name}"'
+        envelope = f"ST_TileEnvelope({z}, {x}, {y})"
+        # the features in the buffer of the tile are kept
+        bounds = "ST_Expand({}, {!r})".format(
+            envelope, MVT_WORLD_SIZE / 2**z * MVT_BUFFER / MVT_EXTENT
+        )
+        # the features are read from the most simplified copy of the
+        # geometries stored for the size of a tile unit
+        tolerance = MVT_WORLD_SIZE / MVT_EXTENT / 2**z
+        if field.srid == convert.WGS84_SRID:
+            tolerance /= METERS_PER_DEGREE
+        geometry = field.simplified_sql(self._table, tolerance)
+        if field.srid != convert.WEB_MERCATOR_SRID:
+            bounds = f"ST_Transform({bounds}, {field.srid})"
+            geometry = f"ST_Transform({geometry}, {convert.WEB_MERCATOR_SRID})"
+        query.add_where(f"{column} && {bounds}")
+        columns = [
+            f'"{self._table}".id',
+            f"ST_AsMVTGeom({geometry}, {envelope}, {MVT_EXTENT}, {MVT_BUFFER}) AS geom",
+        ]
+        if attribute:
+            columns.append(f'"{self._table}"."{attribute.name}"')
+        query_str, params = query.select(*columns)
+        # pylint: disable=E8103
+        self.env.cr.execute(
+            f"""
+            SELECT ST_AsMVT(tile.*, %s, {MVT_EXTENT}, 'geom', 'id')
+            FROM ({query_str}) AS tile
+            WHERE tile.geom IS NOT NULL
+            """,
+            [self._name] + params,
+        )
+        tile = self.env.cr.fetchone()[0]
+        return bytes(tile) if tile else b""
+
+    def geo_label_points(self, field_name):
+        """Return the GeoJSON of a point inside the geometry of each record,
+        by record id, where labels are displayed. The point is read from the
+        label_point companion when the field stores it."""
+        field = self._get_geo_field(field_name)
+        self.check_access_rights("read")
+        self.check_field_access_rights("read", [field_name])
+        self.check_access_rule("read")
+        self.flush_recordset([field_name])
+        label_point = field.companion_sql(self._table, "label_point")
+        # pylint: disable=E8103
+        self.env.cr.execute(
+            f"""
+            SELECT id, ST_AsGeoJSON({label_point})
+            FROM "{self._table}"
+            WHERE id = ANY(%s) AND NOT ST_IsEmpty("{field_name}")
+            """,
+            (list(self.ids),),
+        )
+        return dict(self.env.cr.fetchall())
+
+    def _generate_order_by_inner(
+        self, alias, order_spec, query, reverse_direction=False, seen=None
+    ):
+        """Add the ``<geo_field>:distance`` order, the distance to the
+        geometry given by geo_distance_from in context. It is compiled to
+        the PostGIS <-> operator so the ordering is served by the GiST index
+        of the field, the id breaks ties for a stable pagination."""
+        if ":distance" not in order_spec:
+            return super()._generate_order_by_inner(
+                alias, order_spec, query, reverse_direction, seen
+            )
+        order_by_elements = []
+        seen = set() if seen is None else seen
+        for order_part in order_spec.split(","):
+            order_split = order_part.strip().split(" ")
+            fname, _sep, order_type = order_split[0].strip('"').partition(":")
+            if order_type != "distance":
+                order_by_elements += super()._generate_order_by_inner(
+                    alias, order_part, query, reverse_direction, seen
+                )
+                continue
+            field = self._get_geo_field(fname)
+            if not field.store:
+                raise ValueError(_("%s is not a stored geo field") % fname)
+            if "geo_distance_from" not in self.env.context:
+                raise ValueError(
+                    _("Ordering by %s needs geo_distance_from in context")
+                    % order_split[0]
+                )
+            direction = order_split[1].strip().upper() if len(order_split) == 2 else ""
+            if reverse_direction:
+                direction = "ASC" if direction == "DESC" else "DESC"
+            self.flush_model([fname])
+            distance_from = field.entry_to_sql_literal(
+                self.env.context["geo_distance_from"]
+            )
+            order_by_elements.append(
+                f'"{alias}"."{fname}" <-> {distance_from} {direction}'.rstrip()
+            )
+            order_by_elements.append(f'"{alias}"."id" {direction}'.rstrip())
+        return order_by_elements
+
+    @api.model
+    def geo_nearest(
+        self, field_name, geometry, domain=None, limit=10, offset=0, distance=False
+    ):
+        """Return the records matching domain nearest to geometry, by
+        increasing distance.
+
+        :param field_name: name of a stored geo field
+        :param geometry: geometry in any format accepted by the geo fields
+        :param distance: if True, return a list of ``(record, distance)``
+                         instead, the distance being in the units of the
+                         srid of the field
+        """
+        records = self.with_context(geo_distance_from=geometry).search(
+            domain or [],
+            order=f"{field_name}:distance",
+            limit=limit,
+            offset=offset,
+        )
+        if not distance:
+            return records
+        return list(zip(records, records.geo_distance(field_name, geometry)))
+
+    def geo_join(
+        self,
+        field_name,
+        comodel_name,
+        comodel_field_name,
+        domain=None,
+        operator="geo_intersect",
+        nearest=0,
+    ):
+        """Spatial join of the recordset with the records of another model
+        matching domain, in a single query whatever the size of the
+        recordset.
+
+        The geometries of the recordset are taken from the cache, so the
+        join can be used in computes and onchanges, and are matched with an
+        indexed column of the comodel (JOIN ON the predicate of operator),
+        or with the nearest comodel records (LATERAL ORDER BY <-> LIMIT).
+
+        :param field_name: name of the geo field of the recordset
+        :param comodel_field_name: name of a stored geo field of comodel
+        :param operator: one of GEO_JOIN_OPERATORS, the predicate applied
+                         to (record geometry, comodel geometry)
+        :param nearest: if given, the number of nearest comodel records to
+                        return for each record, operator is then ignored
+        :return: a dict mapping the id of each record to the matching
+                 comodel records, ordered by distance for nearest
+        """
+        comodel = self.env[comodel_name]
+        result = {record.id: comodel.browse() for record in self}
+        order = "b.distance, b.id" if nearest else "b.id"
+        rows = self._geo_join_fetch(
+            field_name,
+            comodel_name,
+            comodel_field_name,
+            f"array_agg(b.id ORDER BY {order})",
+            domain=domain,
+            operator=operator,
+            nearest=nearest,
+        )
+        for record_id, comodel_ids in rows:
+            result[record_id] = comodel.browse(comodel_ids)
+        return result
+
+    def geo_aggregate(
+        self,
+        field_name,
+        comodel_name,
+        comodel_field_name,
+        aggregates,
+        domain=None,
+        operator="geo_intersect",
+    ):
+        """Aggregate fields of the records of another model matching domain
+        that are in spatial relation with each record of the recordset, in
+        a single GROUP BY query whatever the size of the recordset.
+
+        :param aggregates: list of ``"field:function"`` specifications as
+                           in read_group, function being one of
+                           GEO_AGGREGATE_FUNCTIONS
+        :param operator: one of GEO_JOIN_OPERATORS, the predicate applied
+                         to (record geometry, comodel geometry)
+        :return: a dict mapping the id of each record to a dict of the
+                 value of each aggregate specification, the count of a
+                 record without match is 0 and its other values are None
+        """
+        comodel = self.env[comodel_name]
+        fnames = []
+        columns = []
+        for spec in aggregates:
+            fname, _sep, function = spec.partition(":")
+            field = comodel._fields.get(fname)
+            if not field or not field.store or not field.column_type:
+                raise ValueError(
+                    _("%s is not a stored field of %s") % (fname, comodel_name)
+                )
+            if function not in GEO_AGGREGATE_FUNCTIONS:
+                raise ValueError(_("Unsupported aggregate function %s") % function)
+            fnames.append(fname)
+            columns.append(f"{function}(b.c{len(columns)})")
+        defaults = {
+            spec: 0 if spec.partition(":")[2] == "count" else None
+            for spec in aggregates
+        }
+        result = {record.id: dict(defaults) for record in self}
+        rows = self._geo_join_fetch(
+            field_name,
+            comodel_name,
+            comodel_field_name,
+            ", ".join(columns),
+            domain=domain,
+            operator=operator,
+            comodel_fnames=fnames,
+        )
+        for record_id, *values in rows:
+            result[record_id] = dict(zip(aggregates, values))
+        return result
+
+    def _geo_join_fetch(
+        self,
+        field_name,
+        comodel_name,
+        comodel_field_name,
+        select,
+        domain=None,
+        operator="geo_intersect",
+        nearest=0,
+        comodel_fnames=(),
+    ):
+        """Run the spatial join of geo_join grouped by record, and return
+        the rows ``(record id, *select)``. In select, the comodel records
+        are the rows of b with the columns id, geom, the distance for
+        nearest and c0, c1... for the columns of comodel_fnames."""
+        if not nearest and operator not in GEO_JOIN_OPERATORS:
+            raise ValueError(_("Unsupported spatial join operator %s") % operator)
+        field = self._get_geo_field(field_name)
+        comodel = self.env[comodel_name]
+        comodel_field = comodel._get_geo_field(comodel_field_name)
+        if not comodel_field.store:
+            raise ValueError(_("%s is not a stored geo field") % comodel_field_name)
+        self.check_field_access_rights("read", [field_name])
+        comodel.check_access_rights("read")
+        comodel.check_field_access_rights("read", [comodel_field_name, *comodel_fnames])
+        if not self:
+            return []
+        geometries = convert.values_to_shapes(self._geo_cache_values(field_name))
+        if field.srid != comodel_field.srid:
+            geometries = geo_projection.transform_geometries(
+                self.env.cr, geometries, field.srid, comodel_field.srid
+            )
+        domain = domain or []
+        comodel._flush_search(domain, fields=[comodel_field_name, *comodel_fnames])
+        query = comodel._where_calc(domain)
+        comodel._apply_ir_rules(query, "read")
+        comodel_columns = ["id", comodel_field_name, *comodel_fnames]
+        comodel_query, comodel_params = query.select(
+            *(f'"{comodel._table}"."{fname}"' for fname in comodel_columns)
+        )
+        aliases = ", ".join(
+            ["id", "geom"] + [f"c{index}" for index in range(len(comodel_fnames))]
+        )
+        if nearest:
+            join = f"""
+                CROSS JOIN LATERAL (
+                    SELECT b.*, a.geom <-> b.geom AS distance
+                    FROM ({comodel_query}) AS b({aliases})
+                    WHERE NOT ST_IsEmpty(b.geom)
+                    ORDER BY a.geom <-> b.geom, b.id
+                    LIMIT %s
+                ) b
+            """
+            join_params = [*comodel_params, nearest]
+        else:
+            join = f"""
+                JOIN ({comodel_query}) AS b({aliases})
+                    ON {GEO_JOIN_OPERATORS[operator]}(a.geom, b.geom)
+            """
+            join_params = comodel_params
+        # pylint: disable=E8103
+        self.env.cr.execute(
+            f"""
+            WITH a AS MATERIALIZED (
+                SELECT seq, geom::geometry AS geom
+                FROM unnest(%s::text[]) WITH ORDINALITY AS u(geom, seq)
+                WHERE geom IS NOT NULL
+            )
+            SELECT a.seq, {select}
+            FROM a
+            {join}
+            GROUP BY a.seq
+            """,
+            [convert.shapes_to_hex_ewkb(geometries, comodel_field.srid), *join_params],
+        )
+        ids = self._ids
+        return [(ids[seq - 1], *values) for seq, *values in self.env.cr.fetchall()]
+
+    def geo_distance(self, field_name, geometry):
+        """Return the distance of each record of the recordset to geometry,
+        in the units of the srid of the field, None for empty values"""
+        field = self._get_geo_field(field_name)
+        if not field.store:
+            raise ValueError(_("%s is not a stored geo field") % field_name)
+        self.check_access_rights("read")
+        self.check_field_access_rights("read", [field_name])
+        self.check_access_rule("read")
+        self.flush_recordset([field_name])
+        # pylint: disable=E8103
+        self.env.cr.execute(
+            f"""
+            SELECT id, ST_Distance("{field_name}", {field.entry_to_sql_literal(geometry)})
+            FROM "{self._table}"
+            WHERE id = ANY(%s)
+            """,
+            (list(self.ids),),
+        )
+        distance_by_id = dict(self.env.cr.fetchall())
+        return [distance_by_id.get(id_) for id_ in self.ids]
+
+    @api.model
+    def _has_geo_leaf(self, domain):
+        return any(
+            isinstance(element, (list, tuple)) and element[1] in GEO_OPERATORS
+            for element in normalize_domain(domain or [])
+        )
+
+    @api.model
+    def _geo_estimate_count(self, domain):
+        """Return the number of records matching domain as estimated by the
+        query planner, or None if the table is smaller than the
+        base_geoengine.approximate_count_threshold parameter"""
+        threshold = int(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param(
+                "base_geoengine.approximate_count_threshold",
+                APPROXIMATE_COUNT_THRESHOLD,
+            )
+        )
+        # reltuples is -1 for the tables that were never analyzed
+        self.env.cr.execute(
+            "SELECT reltuples FROM pg_class WHERE oid = %s::regclass", (self._table,)
+        )
+        row = self.env.cr.fetchone()
+        if not row or row[0] < threshold:
+            return None
+        query = self._where_calc(domain)
+        self._apply_ir_rules(query, "read")
+        query_str, params = query.select()
+        # pylint: disable=E8103
+        self.env.cr.execute(f"EXPLAIN (FORMAT JSON) {query_str}", params)
+        plan = self.env.cr.fetchone()[0]
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    @api.model
+    def geo_search_count(self, domain, exact=False):
+        """Count the records matching domain. Searches with a geo operator
+        on large tables are counted from the estimate of the query planner
+        unless exact is set. Return a dict with the count and whether it
+        is approximate"""
+        self.check_access_rights("read")
+        if not exact and self._has_geo_leaf(domain):
+            estimate = self._geo_estimate_count(domain)
+            if estimate is not None:
+                return {"count": estimate, "approximate": True}
+        return {"count": self.search_count(domain), "approximate": False}
+
+    @api.model
+    def web_search_read(
+        self,
+        domain=None,
+        fields=None,
+        offset=0,
+        limit=None,
+        order=None,
+        count_limit=None,
+    ):
+        """Use the estimated count of geo_search_count as length when the
+        geo_approximate_count key is in the context, the result then tells
+        whether the length is approximate in approximate_count"""
+        estimate = None
+        if (
+            limit
+            and self.env.context.get("geo_approximate_count")
+            and self._has_geo_leaf(domain)
+        ):
+            estimate = self._geo_estimate_count(domain)
+        if estimate is None:
+            return super().web_search_read(
+                domain=domain,
+                fields=fields,
+                offset=offset,
+                limit=limit,
+                order=order,
+                count_limit=count_limit,
+            )
+        # the count limit is reached by a full page, no exact count is done
+        result = super().web_search_read(
+            domain=domain,
+            fields=fields,
+            offset=offset,
+            limit=limit,
+            order=order,
+            count_limit=offset + limit,
+        )
+        result["approximate_count"] = len(result["records"]) == limit
+        if result["approximate_count"]:
+            result["length"] = max(estimate, offset + limit)
+        return result
+
+    @api.model
+    def geo_search_read_bbox(
+        self,
+        field_name,
+        bbox,
+        domain=None,
+        fields=None,
+        offset=0,
+        limit=None,
+        bbox_srid=None,
+        resolution=None,
+    ):
+        """Same as geo_search_read for the records matching domain whose
+        geometry in field_name is in the bounding box
+        ``[xmin, ymin, xmax, ymax]`` given in bbox_srid (the SRID of the
+        field by default). Only the index of the field is used to compare
+        with the bounding box, the records are ordered by id for a stable
+        paging. Given the resolution of the map in bbox_srid units per
+        pixel, the geometries are simplified for it"""
+        field = self._get_geo_field(field_name)
+        bbox_srid = geo_projection.parse_srid(bbox_srid or field.srid)
+        domain = domain or []
+        self.check_access_rights("read")
+        self._flush_search(domain, fields=[field_name], order="id")
+        query = self._where_calc(domain)
+        self._apply_ir_rules(query, "read")
+        envelope = "ST_MakeEnvelope(%s, %s, %s, %s, %s)"
+        if bbox_srid != field.srid:
+            envelope = f"ST_Transform({envelope}, {field.srid})"
+        query.add_where(
+            f'"{self._table}"."{field.name}" && {envelope}',
+            [float(coordinate) for coordinate in bbox] + [bbox_srid],
+        )
+        query.order = f'"{self._table}".id'
+        query.offset = offset
+        query.limit = limit
+        query_str, params = query.select(f'"{self._table}".id')
+        self.env.cr.execute(query_str, params)
+        ids = [row[0] for row in self.env.cr.fetchall()]
+        context = {"geo_read_postgis": True}
+        if resolution:
+            context.update(geo_resolution=resolution, geo_resolution_srid=bbox_srid)
+        return self.browse(ids).with_context(**context).read(fields)
+
+    @api.model
+    def geo_search_read(
+        self,
+        domain=None,
+        fields=None,
+        offset=0,
+        limit=None,
+        order=None,
+        precision=None,
+        zoom=None,
+        tolerance=None,
+    ):
+        """Same as search_read, but the geo fields are serialized to GeoJSON
+        by PostGIS and passed through to the response as is. They are
+        simplified for a zoom level of the spherical mercator tiles or with
+        a tolerance if given"""
+        context = {"geo_read_postgis": True}
+        if precision is not None:
+            context["geo_precision"] = precision
+        if zoom is not None:
+            context["geo_zoom"] = zoom
+        if tolerance:
+            context["geo_simplify_tolerance"] = tolerance
+        return self.with_context(**context).search_read(
+            domain=domain, fields=fields, offset=offset, limit=limit, order=order
+        )
+
     @api.model
     def geo_search(
         self, domain=None, geo_domain=None, offset=0, limit=None, order=None
@@ -150,7 +1153,8 @@ class Base(models.AbstractModel):
          * geo_touch
          * geo_within
          * geo_contains
-         * geo_intersect"""
+         * geo_intersect
+         * geo_dwithin, the value is a pair (geometry, distance)"""
         # First we do a standard search in order to apply security rules
         # and do a search on standard attributes
         # Limit and offset are managed after, we may loose a lot of performance
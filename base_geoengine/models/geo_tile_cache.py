@@ -0,0 +1,231 @@
+# Copyright 2023 ACSONE SA/NV
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+import hashlib
+import itertools
+import json
+import logging
+
+from odoo import api, fields, models
+
+from .. import geo_convertion_helper as convert, geo_projection
+from .base import MVT_BUFFER, MVT_EXTENT, MVT_WORLD_SIZE
+
+_logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except ImportError:
+    _logger.warning("Numpy is not available in the sys path")
+
+# total size of the cached tiles, in bytes
+TILE_CACHE_MAX_SIZE = 256 * 1024 * 1024
+# the size of the cache is checked each time a worker stored this number
+# of tiles, and by the autovacuum
+TILE_CACHE_EVICTION_INTERVAL = 64
+# zoom levels warmed by seed_tiles
+TILE_CACHE_SEED_MAX_ZOOM = 6
+
+_stored_tiles = itertools.count(1)
+
+
+class GeoTileCache(models.Model):
+    """Vector tiles of the layers that use the tile cache. The tiles are
+    keyed by layer, domain and record rules of the user, and dropped when a
+    record whose geometry crosses their bounding box changes"""
+
+    _name = "geoengine.tile.cache"
+    _description = "Vector Tile Cache"
+    _log_access = False
+
+    layer_id = fields.Many2one(
+        "geoengine.vector.layer", required=True, ondelete="cascade", index=True
+    )
+    model_name = fields.Char(required=True, index=True)
+    field_name = fields.Char(required=True)
+    key = fields.Char(required=True)
+    z = fields.Integer(required=True)
+    x = fields.Integer(required=True)
+    y = fields.Integer(required=True)
+    tile = fields.Binary(attachment=False)
+    size = fields.Integer()
+    bbox = fields.GeoPolygon(srid=convert.WEB_MERCATOR_SRID)
+
+    _sql_constraints = [
+        ("tile_uniq", "unique (key, z, x, y)", "A tile can only be cached once.")
+    ]
+
+    @api.model
+    def _get_key(self, layer, domain):
+        """Return the key of the tiles of a layer for a domain and the record
+        rules of the current user"""
+        model_name = layer.geo_field_id.model
+        rules_domain = (
+            [] if self.env.su else self.env["ir.rule"]._compute_domain(model_name)
+        )
+        data = json.dumps(
+            [
+                layer.id,
+                model_name,
+                layer.geo_field_id.name,
+                layer.attribute_field_id.name,
+                domain,
+                rules_domain,
+                self.env.su,
+                self.env.lang,
+            ],
+            default=str,
+        )
+        return hashlib.sha1(data.encode()).hexdigest()
+
+    @api.model
+    def get_tile(self, layer, z, x, y, domain=None):
+        """Return the Mapbox Vector Tile z/x/y of a layer, the tile is only
+        generated if it is not in the cache"""
+        records = self.env[layer.geo_field_id.model]
+        field_name = layer.geo_field_id.name
+        attribute_field_name = layer.attribute_field_id.name or None
+        if domain is None:
+            domain = layer._get_tile_domain()
+        records.check_access_rights("read")
+        records.check_field_access_rights(
+            "read", [name for name in (field_name, attribute_field_name) if name]
+        )
+        # the pending changes of the geometries drop the tiles they cross
+        records.flush_model([field_name])
+        key = self._get_key(layer, domain)
+        self.env.cr.execute(
+            """
+            SELECT tile FROM geoengine_tile_cache
+            WHERE key = %s AND z = %s AND x = %s AND y = %s
+            """,
+            (key, z, x, y),
+        )
+        row = self.env.cr.fetchone()
+        if row:
+            return bytes(row[0] or b"")
+        tile = records.geo_tile(
+            field_name,
+            z,
+            x,
+            y,
+            domain=domain,
+            attribute_field_name=attribute_field_name,
+        )
+        self._store_tile(layer, key, z, x, y, tile)
+        return tile
+
+    @api.model
+    def _store_tile(self, layer, key, z, x, y, tile):
+        self.env.cr.execute(
+            """
+            INSERT INTO geoengine_tile_cache
+                (layer_id, model_name, field_name, key, z, x, y, tile, size, bbox)
+            VALUES (
+                %s, %s, %s, %s, %s, %s, %s, %s, %s,
+                ST_Expand(ST_TileEnvelope(%s, %s, %s), %s)
+            )
+            ON CONFLICT (key, z, x, y) DO NOTHING
+            """,
+            (
+                layer.id,
+                layer.geo_field_id.model,
+                layer.geo_field_id.name,
+                key,
+                z,
+                x,
+                y,
+                tile,
+                len(tile),
+                z,
+                x,
+                y,
+                # the features in the buffer of the tile are in the tile
+                MVT_WORLD_SIZE / 2**z * MVT_BUFFER / MVT_EXTENT,
+            ),
+        )
+        if next(_stored_tiles) % TILE_CACHE_EVICTION_INTERVAL == 0:
+            self._evict()
+
+    @api.model
+    def _evict(self):
+        """Drop the oldest tiles beyond the base_geoengine.tile_cache_max_size
+        parameter, in bytes"""
+        max_size = int(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("base_geoengine.tile_cache_max_size", TILE_CACHE_MAX_SIZE)
+        )
+        self.env.cr.execute(
+            """
+            DELETE FROM geoengine_tile_cache
+            WHERE id IN (
+                SELECT id
+                FROM (
+                    SELECT id, sum(size) OVER (ORDER BY id DESC) AS total_size
+                    FROM geoengine_tile_cache
+                ) AS tiles
+                WHERE total_size > %s
+            )
+            """,
+            (max_size,),
+        )
+
+    @api.autovacuum
+    def _gc_tiles(self):
+        self._evict()
+
+    @api.model
+    def _invalidate_records(self, records, field_names):
+        """Drop the tiles of the geo fields field_names that intersect the
+        bounding box of the geometries of the records"""
+        if not records.ids:
+            return
+        for field_name in field_names:
+            box = f'ST_Envelope(record."{field_name}")'
+            if records._fields[field_name].srid != convert.WEB_MERCATOR_SRID:
+                box = f"ST_Transform({box}, {convert.WEB_MERCATOR_SRID})"
+            # pylint: disable=E8103
+            self.env.cr.execute(
+                f"""
+                DELETE FROM geoengine_tile_cache AS tile
+                USING "{records._table}" AS record
+                WHERE record.id IN %s
+                    AND tile.model_name = %s
+                    AND tile.field_name = %s
+                    AND tile.bbox && {box}
+                """,
+                (tuple(records.ids), records._name, field_name),
+            )
+
+    @api.model
+    def _seed_layer(self, layer, max_zoom):
+        """Generate the tiles of a layer from the zoom level 0 to max_zoom
+        over the extent of its features, return the number of tiles"""
+        domain = layer._get_tile_domain()
+        if domain is None:
+            return 0
+        records = self.env[layer.geo_field_id.model]
+        field = records._fields[layer.geo_field_id.name]
+        extent = records.geo_extent(field.name, domain)
+        if not extent:
+            return 0
+        xs, ys = geo_projection.transform_coordinates(
+            self.env.cr,
+            extent[0::2],
+            extent[1::2],
+            field.srid,
+            convert.WEB_MERCATOR_SRID,
+        )
+        count = 0
+        for z in range(max_zoom + 1):
+            tile_size = MVT_WORLD_SIZE / 2**z
+            # the rows of the tiles are numbered from the north
+            columns = np.floor((np.asarray(xs) + MVT_WORLD_SIZE / 2) / tile_size)
+            rows = np.floor((MVT_WORLD_SIZE / 2 - np.asarray(ys)) / tile_size)
+            min_x, max_x = np.clip(columns, 0, 2**z - 1).astype(int)
+            max_y, min_y = np.clip(rows, 0, 2**z - 1).astype(int)
+            for x in range(min_x, max_x + 1):
+                for y in range(min_y, max_y + 1):
+                    self.get_tile(layer, z, x, y, domain=domain)
+                    count += 1
+        return count
@@ -3,8 +3,11 @@
 # Copyright 2023 ACSONE SA/NV
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-from odoo import _, api, fields, models
+from odoo import _, api, fields, models, tools
 from odoo.exceptions import ValidationError
+from odoo.tools.safe_eval import safe_eval
+
+from .geo_tile_cache import TILE_CACHE_SEED_MAX_ZOOM
 
 SUPPORTED_ATT = [
     "float",
@@ -20,6 +23,13 @@ SUPPORTED_ATT = [
 ]
 
 NUMBER_ATT = ["float", "integer", "integer_big"]
+# fields of the layers the cached tiles depend on
+TILE_KEY_FIELDS = {
+    "geo_field_id",
+    "attribute_field_id",
+    "model_domain",
+    "use_tile_cache",
+}
 
 
 class GeoVectorLayer(models.Model):
@@ -79,6 +89,15 @@ class GeoVectorLayer(models.Model):
     sequence = fields.Integer("Layer Priority", default=6)
     readonly = fields.Boolean("Layer is read only")
     display_polygon_labels = fields.Boolean("Display Labels on Polygon")
+    use_vector_tiles = fields.Boolean(
+        "Load as vector tiles",
+        help="The features of a layer on another model are loaded by "
+        "Mapbox Vector Tiles of the visible area instead of all at once.",
+    )
+    use_tile_cache = fields.Boolean(
+        "Cache vector tiles",
+        help="The vector tiles are kept until the records they show change.",
+    )
     active_on_startup = fields.Boolean(
         help="Layer will be shown on startup if checked."
     )
@@ -134,6 +153,68 @@ class GeoVectorLayer(models.Model):
                         )
                     )
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        layers = super().create(vals_list)
+        if any(layer.use_tile_cache for layer in layers):
+            self.clear_caches()
+        return layers
+
+    def write(self, vals):
+        res = super().write(vals)
+        if self.ids and TILE_KEY_FIELDS & set(vals):
+            self.env.cr.execute(
+                "DELETE FROM geoengine_tile_cache WHERE layer_id IN %s",
+                (tuple(self.ids),),
+            )
+        if {"geo_field_id", "use_tile_cache"} & set(vals):
+            self.clear_caches()
+        return res
+
+    def unlink(self):
+        tile_cache = any(layer.use_tile_cache for layer in self)
+        res = super().unlink()
+        if tile_cache:
+            self.clear_caches()
+        return res
+
+    @api.model
+    @tools.ormcache()
+    def _get_tile_cache_fields(self):
+        """Return the geo fields whose tiles are cached by model"""
+        fields_by_model = {}
+        for layer in self.sudo().search([("use_tile_cache", "=", True)]):
+            fields_by_model.setdefault(layer.geo_field_id.model, set()).add(
+                layer.geo_field_id.name
+            )
+        return {model: tuple(sorted(names)) for model, names in fields_by_model.items()}
+
+    def _get_tile_domain(self):
+        """Return the model domain of the layer, or None if it depends on the
+        records displayed in the view"""
+        self.ensure_one()
+        if "ACTIVE_IDS" in (self.model_domain or ""):
+            return None
+        return safe_eval(self.model_domain or "[]")
+
+    def seed_tiles(self, max_zoom=None):
+        """Warm the tile cache of the layers from the zoom level 0 to
+        max_zoom, by default the base_geoengine.tile_cache_seed_max_zoom
+        parameter. Return the number of tiles"""
+        cache = self.env["geoengine.tile.cache"]
+        if max_zoom is None:
+            max_zoom = int(
+                self.env["ir.config_parameter"]
+                .sudo()
+                .get_param(
+                    "base_geoengine.tile_cache_seed_max_zoom", TILE_CACHE_SEED_MAX_ZOOM
+                )
+            )
+        count = 0
+        for layer in self.filtered("use_tile_cache"):
+            count += cache._seed_layer(layer, max_zoom)
+        return count
+
     @api.depends("model_id")
     def _compute_model_view_id(self):
         for rec in self:
@@ -5,6 +5,8 @@ from odoo import fields, models
 
 from odoo.addons import base
 
+from ..geo_db import register_geometry_typecaster
+
 if "geoengine" not in base.models.ir_actions.VIEW_TYPES:
     base.models.ir_actions.VIEW_TYPES.append(("geoengine", "Geoengine"))
 
@@ -49,3 +51,7 @@ class IrModelField(models.Model):
         selection_add=GEO_TYPES,
         ondelete=GEO_TYPES_ONDELETE,
     )
+
+    def _register_hook(self):
+        register_geometry_typecaster(self.env.cr, refresh=True)
+        return super()._register_hook()
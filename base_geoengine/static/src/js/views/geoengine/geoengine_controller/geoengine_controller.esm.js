@@ -20,6 +20,7 @@ export class GeoengineController extends Component {
         this.state = useState({isSavedOrDiscarded: false});
         this.actionService = useService("action");
         this.view = useService("view");
+        this.orm = useService("orm");
         this.addDialog = useOwnedDialogs();
         this.editable = this.props.archInfo.editable;
         this.model = useModel(this.props.Model, {
@@ -28,6 +29,16 @@ export class GeoengineController extends Component {
             fields: this.props.fields,
             limit: this.props.limit,
         });
+        this.countState = useState({approximate: false});
+        // The server tells in the response of web_search_read whether the
+        // count of the records is estimated, no other request is needed.
+        const orm = this.model.orm;
+        const webSearchRead = orm.webSearchRead.bind(orm);
+        orm.webSearchRead = async (...args) => {
+            const result = await webSearchRead(...args);
+            this.countState.approximate = Boolean(result.approximate_count);
+            return result;
+        };
 
         /**
          * Allow you to display records on the map thanks to the paging located
@@ -44,9 +55,31 @@ export class GeoengineController extends Component {
                     await list.load({limit, offset});
                     this.render(true);
                 },
+                // The total of geo searches on large tables is estimated,
+                // the exact count is fetched on request.
+                updateTotal:
+                    this.countState.approximate && list.records.length >= limit
+                        ? () => this.fetchExactCount()
+                        : undefined,
             };
         });
     }
+
+    /**
+     * Replace the estimated count of the records by the exact one.
+     */
+    async fetchExactCount() {
+        const list = this.model.root;
+        const {count} = await this.orm.call(
+            this.props.resModel,
+            "geo_search_count",
+            [list.domain],
+            {exact: true, context: this.props.context}
+        );
+        list.count = count;
+        this.countState.approximate = false;
+        this.render(true);
+    }
     /**
      * Allow you to open the form editing view for the filled-in model.
      * @param {*} resModel
@@ -14,6 +14,8 @@ import {useService} from "@web/core/utils/hooks";
 import {registry} from "@web/core/registry";
 import {RelationalModel} from "@web/views/relational_model";
 import {evaluateExpr} from "@web/core/py_js/py";
+import {debounce} from "@web/core/utils/timing";
+import {deserializeDate, deserializeDateTime} from "@web/core/l10n/dates";
 import {
     Component,
     mount,
@@ -33,6 +35,10 @@ const DEFAULT_MAX_SIZE = 15;
 // For choroplets only
 const DEFAULT_NUM_CLASSES = 5;
 const LEGEND_MAX_ITEMS = 10;
+// Layers on another model load the features of the cells of a grid covering
+// the map extent, the cells are loaded once by zoom level.
+const EXTENT_LOAD_DELAY = 250;
+const EXTENT_LOAD_LIMIT = 2000;
 
 export class GeoengineRenderer extends Component {
     setup() {
@@ -41,6 +47,14 @@ export class GeoengineRenderer extends Component {
         this.cfg_models = [];
         this.vectorModel = {};
         this.legends = [];
+        // Label points computed by the server by layer
+        this.labelPoints = {};
+        // Layers loading the features of the map extent by layer
+        this.extentLayers = {};
+        this.debouncedLoadExtentLayers = debounce(
+            () => this.loadExtentLayers(),
+            EXTENT_LOAD_DELAY
+        );
 
         // When a change is issued in the rasterLayersStore or the vectorLayersStore the LayerChanged method is called.
         this.rasterLayersStore = reactive(rasterLayersStore, () =>
@@ -142,6 +156,7 @@ export class GeoengineRenderer extends Component {
             if (newZoom !== localStorage.getItem("ol-zoom")) {
                 localStorage.setItem("ol-zoom", newZoom);
             }
+            this.debouncedLoadExtentLayers();
         });
     }
 
@@ -423,8 +438,11 @@ export class GeoengineRenderer extends Component {
         if (this.selectClick !== undefined && this.selectPointerMove !== undefined) {
             this.map.removeInteraction(this.selectClick);
             this.map.removeInteraction(this.selectPointerMove);
+            ol.Observable.unByKey(this.vectorTileClickKey);
             this.selectClick = undefined;
             this.selectPointerMove = undefined;
+            this.vectorTileClickKey = undefined;
+            this.selectVectorTileFeature(undefined);
         }
     }
 
@@ -439,7 +457,9 @@ export class GeoengineRenderer extends Component {
 
     /**
      * Add 2 interactions. The first is for the hovering elements.
-     * The second is for the click on the feature.
+     * The second is for the click on the feature. The features of the vector
+     * tiles are not handled by the interactions, a click on them is handled
+     * by the map.
      */
     registerInteraction() {
         this.selectPointerMove = new ol.interaction.Select({
@@ -453,12 +473,93 @@ export class GeoengineRenderer extends Component {
 
         this.selectClick.on("select", (e) => {
             const features = e.target.getFeatures();
+            this.selectVectorTileFeature(undefined);
             this.updateInfoBox(features);
         });
+        this.vectorTileClickKey = this.map.on("click", (e) =>
+            this.onVectorTileClick(e)
+        );
         this.map.addInteraction(this.selectClick);
         this.map.addInteraction(this.selectPointerMove);
     }
 
+    /**
+     * The features of the vector tiles are RenderFeatures, they only carry
+     * the id of their record and the attribute field of the layer. When the
+     * topmost feature clicked is one of them, it is selected and its record
+     * is read to be displayed in the info box. Otherwise the click is left to
+     * the select interaction.
+     * @param {*} e
+     * @returns {Boolean} false to stop the select interaction
+     */
+    onVectorTileClick(e) {
+        const hit = this.map.forEachFeatureAtPixel(e.pixel, (feature, layer) => ({
+            feature,
+            layer,
+        }));
+        if (
+            !hit ||
+            !(hit.feature instanceof ol.render.Feature) ||
+            !hit.layer.get("cfg")
+        ) {
+            if (this.selectedVectorTileFeature) {
+                this.selectVectorTileFeature(undefined);
+                this.hidePopup();
+            }
+            return true;
+        }
+        const {feature, layer} = hit;
+        this.selectClick.getFeatures().clear();
+        this.selectVectorTileFeature({layer, id: feature.getId()});
+        this.updateVectorTileInfoBox(feature, layer.get("cfg"));
+        return false;
+    }
+
+    /**
+     * Highlights a feature of a vector tile layer with the select style,
+     * the previously selected one is restored.
+     * @param {*} selection
+     */
+    selectVectorTileFeature(selection) {
+        const previous = this.selectedVectorTileFeature;
+        this.selectedVectorTileFeature = selection;
+        if (previous) {
+            previous.layer.changed();
+        }
+        if (selection) {
+            selection.layer.changed();
+        }
+    }
+
+    /**
+     * Allow you to display the record of a feature of a vector tile in the
+     * info box.
+     * @param {*} feature
+     * @param {*} cfg
+     */
+    async updateVectorTileInfoBox(feature, cfg) {
+        const model = this.models.find((el) => el.model.resModel === cfg.model);
+        const [values] = await this.orm.read(
+            cfg.model,
+            [feature.getId()],
+            this.getExtentFieldsToRead(cfg).filter(
+                (fieldName) => fieldName !== cfg.geo_field_id[1]
+            )
+        );
+        const selection = this.selectedVectorTileFeature;
+        if (!values || !selection || selection.id !== feature.getId()) {
+            return;
+        }
+        this.mountGeoengineRecord({
+            popup: this.getPopup(),
+            archInfo: model.archInfo,
+            templateDocs: model.archInfo.templateDocs,
+            model: model.model,
+            attributes: values,
+        });
+        this.overlay.setPosition(ol.extent.getCenter(feature.getExtent()));
+    }
+
     /**
      * This is the style that is set when selecting or clicking on a feature.
      * @param {*} feature
@@ -481,10 +582,11 @@ export class GeoengineRenderer extends Component {
                     }),
                     zIndex: Infinity,
                 });
+            case "Polygon":
             case "MultiPolygon":
                 return new ol.style.Style({
                     fill: new ol.style.Fill({
-                        color: chroma(feature.values_.attributes.color)
+                        color: chroma(feature.get("attributes").color)
                             .alpha(0.4)
                             .css(),
                     }),
@@ -551,7 +653,8 @@ export class GeoengineRenderer extends Component {
     mountGeoengineRecord({popup, archInfo, templateDocs, model, attributes, record}) {
         this.record =
             record === undefined
-                ? model.records.find((record) => record._values.id === attributes.id)
+                ? model.records.find((record) => record._values.id === attributes.id) ||
+                  this.makeExtentRecord(model, attributes)
                 : record;
         mount(GeoengineRecord, popup, {
             env: this.env,
@@ -710,17 +813,14 @@ export class GeoengineRenderer extends Component {
         if (element !== null) {
             element.remove();
         }
-        if (vector.model) {
+        if (layer instanceof ol.layer.VectorTile) {
+            await this.updateVectorTileLayer(vector, layer);
+        } else if (vector.model) {
             this.cfg_models.push(vector.model);
-            const fields_to_read = [vector.geo_field_id[1]];
-            if (vector.attribute_field_id) {
-                fields_to_read.push(vector.attribute_field_id[1]);
-            }
-            const data = await this.getModelData(vector, fields_to_read);
-            this.styleVectorLayerAndLegend(vector, data, layer);
-            this.useRelatedModel(vector, layer, data);
+            await this.updateExtentLayer(vector, layer);
         } else {
             const data = this.props.data.records;
+            await this.loadLabelPoints(vector, data);
             this.styleVectorLayerAndLegend(vector, data, layer);
             this.addSourceToLayer(data, vector, layer);
         }
@@ -733,6 +833,10 @@ export class GeoengineRenderer extends Component {
      */
     onVisibleChanged(vector, layer) {
         layer.setVisible(vector.isVisible);
+        const extentLayer = this.extentLayers[vector.resId];
+        if (vector.isVisible && extentLayer && extentLayer.layer === layer) {
+            this.loadExtentLayer(extentLayer);
+        }
     }
 
     /**
@@ -746,11 +850,11 @@ export class GeoengineRenderer extends Component {
         if (element !== null) {
             element.remove();
         }
-        const fields_to_read = this.getFieldsToRead(vector);
-        const data = await this.getModelData(vector, fields_to_read);
-        this.useRelatedModel(vector, layer, data);
-        const styleInfo = this.styleVectorLayer(vector, data);
-        this.initLegend(styleInfo, vector);
+        if (layer instanceof ol.layer.VectorTile) {
+            await this.updateVectorTileLayer(vector, layer);
+        } else {
+            await this.updateExtentLayer(vector, layer);
+        }
     }
 
     async renderVectorLayers() {
@@ -796,6 +900,9 @@ export class GeoengineRenderer extends Component {
     }
 
     async createVectorLayer(cfg) {
+        if (this.usesVectorTiles(cfg)) {
+            return this.createVectorTileLayer(cfg);
+        }
         var lv = new ol.layer.Vector({
             title: cfg.name,
             active_on_startup: cfg.active_on_startup,
@@ -803,11 +910,8 @@ export class GeoengineRenderer extends Component {
         // If we want to use an other model in the layer
         if (cfg.model) {
             this.cfg_models.push(cfg.model);
-            const fields_to_read = this.getFieldsToRead(cfg);
             await this.loadView(cfg.model, "geoengine");
-            const data = await this.getModelData(cfg, fields_to_read);
-            this.styleVectorLayerAndLegend(cfg, data, lv);
-            this.useRelatedModel(cfg, lv, data);
+            await this.updateExtentLayer(cfg, lv);
         } else {
             const data = this.props.data.records;
             if (!data.length) {
@@ -816,6 +920,7 @@ export class GeoengineRenderer extends Component {
                     title: cfg.name,
                 });
             }
+            await this.loadLabelPoints(cfg, data);
             this.styleVectorLayerAndLegend(cfg, data, lv);
             this.addSourceToLayer(data, cfg, lv);
         }
@@ -826,6 +931,120 @@ export class GeoengineRenderer extends Component {
         return lv;
     }
 
+    /**
+     * Layers on another model may load their features by vector tiles of the
+     * visible area. The tiles are served in the spherical mercator grid.
+     * @param {*} cfg
+     * @returns {Boolean}
+     */
+    usesVectorTiles(cfg) {
+        return Boolean(
+            cfg.model &&
+                cfg.use_vector_tiles &&
+                this.map.getView().getProjection().getCode() === "EPSG:3857"
+        );
+    }
+
+    async createVectorTileLayer(cfg) {
+        this.cfg_models.push(cfg.model);
+        await this.loadView(cfg.model, "geoengine");
+        const layer = new ol.layer.VectorTile({
+            title: cfg.name,
+            active_on_startup: cfg.active_on_startup,
+        });
+        await this.updateVectorTileLayer(cfg, layer);
+        if (cfg.layer_opacity) {
+            layer.setOpacity(cfg.layer_opacity);
+        }
+        layer.setZIndex(cfg.sequence);
+        return layer;
+    }
+
+    /**
+     * Styles a vector tile layer and gives it a new source of tiles for the
+     * domain of the layer.
+     * @param {*} cfg
+     * @param {*} layer
+     */
+    async updateVectorTileLayer(cfg, layer) {
+        const data = await this.getLayerAttributeData(cfg);
+        const styleInfo = this.styleVectorLayer(cfg, data);
+        this.initLegend(styleInfo, cfg);
+        layer.set("cfg", cfg);
+        layer.setStyle(this.getVectorTileStyle(cfg, layer, styleInfo.style));
+        const params = new URLSearchParams({
+            layer_id: cfg.resId,
+            domain: JSON.stringify(this.evalModelDomain(cfg)),
+        });
+        layer.setSource(
+            new ol.source.VectorTile({
+                format: new ol.format.MVT(),
+                url: `/geoengine/tiles/${cfg.model}/${cfg.geo_field_id[1]}/{z}/{x}/{y}.pbf?${params}`,
+            })
+        );
+    }
+
+    /**
+     * The classes of colored and proportional layers are computed from the
+     * values of the attribute field, they are read without the geometries.
+     * @param {*} cfg
+     * @returns {Array}
+     */
+    async getLayerAttributeData(cfg) {
+        if (
+            !cfg.attribute_field_id ||
+            !["colored", "proportion"].includes(cfg.geo_repr)
+        ) {
+            return [];
+        }
+        const data = await this.orm.searchRead(
+            cfg.model,
+            this.evalModelDomain(cfg),
+            [cfg.attribute_field_id[1]]
+        );
+        return data.map((values) => ({_values: values}));
+    }
+
+    /**
+     * The features of the tiles carry the attribute field as property, the
+     * style of the layer is given them as attributes. The selected feature
+     * of the layer is given the select style.
+     * @param {*} cfg
+     * @param {*} layer
+     * @param {*} style
+     */
+    getVectorTileStyle(cfg, layer, style) {
+        const attribute = cfg.attribute_field_id && cfg.attribute_field_id[1];
+        return (feature, resolution) => {
+            const attributes = {
+                ...feature.getProperties(),
+                id: feature.getId(),
+                color: cfg.begin_color,
+                label:
+                    cfg.display_polygon_labels === true
+                        ? feature.get(attribute) ?? ""
+                        : "",
+            };
+            const styledFeature = {
+                get: (key) => (key === "attributes" ? attributes : feature.get(key)),
+                getGeometry: () => feature.getGeometry(),
+            };
+            const selection = this.selectedVectorTileFeature;
+            const selectStyle =
+                selection &&
+                selection.layer === layer &&
+                selection.id === feature.getId() &&
+                this.selectStyle(styledFeature);
+            if (selectStyle) {
+                return selectStyle;
+            }
+            if (typeof style !== "function") {
+                return style;
+            }
+            return style(styledFeature, resolution);
+        };
+    }
+
     getFieldsToRead(cfg) {
         const fields_to_read = [cfg.geo_field_id[1]];
         if (cfg.attribute_field_id) {
@@ -834,13 +1053,180 @@ export class GeoengineRenderer extends Component {
         return fields_to_read;
     }
 
-    async getModelData(cfg, fields_to_read) {
-        const domain = this.evalModelDomain(cfg);
-        let data = await this.orm.searchRead(cfg.model, [domain][0], fields_to_read);
-        const modelsRecords = this.models.find((e) => e.model.resModel === cfg.model)
-            .model.records;
-        data = data.map((data) => modelsRecords.find((rec) => rec.resId === data.id));
-        return data;
+    /**
+     * Styles a layer on another model and gives it a new source, filled
+     * with the features of the map extent.
+     * @param {*} cfg
+     * @param {*} layer
+     */
+    async updateExtentLayer(cfg, layer) {
+        const data = await this.getLayerAttributeData(cfg);
+        this.styleVectorLayerAndLegend(cfg, data, layer);
+        const source = new ol.source.Vector();
+        layer.setSource(source);
+        delete this.labelPoints[cfg.resId];
+        // The cells loaded in the previous source are forgotten
+        const extentLayer = {cfg, layer, source, loadedCells: new Set()};
+        this.extentLayers[cfg.resId] = extentLayer;
+        await this.loadExtentLayer(extentLayer);
+    }
+
+    loadExtentLayers() {
+        Object.values(this.extentLayers).forEach((extentLayer) =>
+            this.loadExtentLayer(extentLayer)
+        );
+    }
+
+    /**
+     * Loads the features of the cells of the map extent that are not loaded
+     * yet. The geometries are simplified by the server for the zoom level of
+     * the cells, the features of a cell replace the ones loaded at another
+     * zoom level.
+     * @param {*} extentLayer
+     */
+    async loadExtentLayer(extentLayer) {
+        const {cfg, layer, source, loadedCells} = extentLayer;
+        const view = this.map.getView();
+        if (!layer.getVisible() || !this.map.getSize()) {
+            return;
+        }
+        const tileGrid = ol.tilegrid.createForProjection(view.getProjection());
+        const extent = ol.extent.getIntersection(
+            view.calculateExtent(this.map.getSize()),
+            tileGrid.getExtent()
+        );
+        if (ol.extent.isEmpty(extent)) {
+            return;
+        }
+        const z = tileGrid.getZForResolution(view.getResolution());
+        const cells = [];
+        tileGrid.forEachTileCoord(extent, z, (tileCoord) => {
+            const key = tileCoord.join("/");
+            if (!loadedCells.has(key)) {
+                loadedCells.add(key);
+                cells.push(tileCoord);
+            }
+        });
+        await Promise.all(
+            cells.map(async (tileCoord) => {
+                const rows = await this.searchReadExtent(
+                    cfg,
+                    tileGrid.getTileCoordExtent(tileCoord),
+                    tileGrid.getResolution(z)
+                );
+                // The source was replaced while the cell was loading
+                if (this.extentLayers[cfg.resId] !== extentLayer) {
+                    return;
+                }
+                const data = rows.map((values) => {
+                    const feature = source.getFeatureById(values.id);
+                    if (feature) {
+                        source.removeFeature(feature);
+                    }
+                    return {resId: values.id, _values: values};
+                });
+                await this.loadLabelPoints(cfg, data, true);
+                this.addFeatureToSource(data, cfg, source);
+            })
+        );
+    }
+
+    /**
+     * Reads the records of a layer whose geometry is in an extent of the map,
+     * by pages of EXTENT_LOAD_LIMIT records, with their geometries
+     * simplified for the resolution of the map.
+     * @param {*} cfg
+     * @param {*} extent
+     * @param {Number} resolution
+     * @returns {Array}
+     */
+    async searchReadExtent(cfg, extent, resolution) {
+        const rows = [];
+        let page = [];
+        do {
+            page = await this.orm.call(
+                cfg.model,
+                "geo_search_read_bbox",
+                [cfg.geo_field_id[1], extent],
+                {
+                    domain: this.evalModelDomain(cfg),
+                    fields: this.getExtentFieldsToRead(cfg),
+                    offset: rows.length,
+                    limit: EXTENT_LOAD_LIMIT,
+                    bbox_srid: this.map.getView().getProjection().getCode(),
+                    resolution,
+                }
+            );
+            rows.push(...page);
+        } while (page.length === EXTENT_LOAD_LIMIT);
+        return rows;
+    }
+
+    /**
+     * The fields of the info box of the model are read with the geometries.
+     * @param {*} cfg
+     * @returns {Array}
+     */
+    getExtentFieldsToRead(cfg) {
+        const fields_to_read = this.getFieldsToRead(cfg);
+        const {model, archInfo} = this.models.find(
+            (e) => e.model.resModel === cfg.model
+        );
+        for (const fieldName in archInfo.activeFields) {
+            const field = model.fields[fieldName];
+            if (
+                field &&
+                !["one2many", "many2many"].includes(field.type) &&
+                !fields_to_read.includes(fieldName)
+            ) {
+                fields_to_read.push(fieldName);
+            }
+        }
+        return fields_to_read;
+    }
+
+    /**
+     * Builds the record displayed in the info box from the values read with
+     * the features of the map extent.
+     * @param {*} model
+     * @param {*} values
+     * @returns {Object}
+     */
+    makeExtentRecord({resModel, fields}, values) {
+        const _values = {...values};
+        for (const fieldName in _values) {
+            const field = fields[fieldName];
+            if (field && field.type === "date" && _values[fieldName]) {
+                _values[fieldName] = deserializeDate(_values[fieldName]);
+            } else if (field && field.type === "datetime" && _values[fieldName]) {
+                _values[fieldName] = deserializeDateTime(_values[fieldName]);
+            }
+        }
+        return {resModel, resId: values.id, fields, _values};
+    }
+
+    /**
+     * Loads the points where the labels of the layer are displayed. They are
+     * computed by the server (a point on the surface of each geometry) and
+     * read from the stored label_point companion of the field when it has one.
+     * @param {*} cfg
+     * @param {*} data
+     * @param {Boolean} merge add the points to the ones already loaded
+     */
+    async loadLabelPoints(cfg, data, merge = false) {
+        if (!merge) {
+            delete this.labelPoints[cfg.resId];
+        }
+        const resIds = data.filter((record) => record).map((record) => record.resId);
+        if (cfg.display_polygon_labels !== true || !resIds.length) {
+            return;
+        }
+        const labelPoints = await this.orm.call(
+            cfg.model || this.props.data.resModel,
+            "geo_label_points",
+            [resIds, cfg.geo_field_id[1]]
+        );
+        this.labelPoints[cfg.resId] = {...this.labelPoints[cfg.resId], ...labelPoints};
     }
 
     styleVectorLayerAndLegend(cfg, data, lv) {
@@ -865,17 +1251,6 @@ export class GeoengineRenderer extends Component {
         }
     }
 
-    /**
-     * This method is called when a layer uses another model.
-     * @param {*} cfg
-     * @param {*} lv
-     */
-    useRelatedModel(cfg, lv, res) {
-        const vectorSource = new ol.source.Vector();
-        this.addFeatureToSource(res, cfg, vectorSource);
-        lv.setSource(vectorSource);
-    }
-
     /**
      * Set source to the given layer.
      * @param {*} res
@@ -937,7 +1312,7 @@ export class GeoengineRenderer extends Component {
             resModel: model,
             views: [[false, view]],
         });
-        const {ArchParser, Model} = viewRegistry.get(view);
+        const {ArchParser} = viewRegistry.get(view);
         const archInfo = new ArchParser().parse(views[view].arch, relatedModels, model);
 
         if (model === "geoengine.vector.layer") {
@@ -952,13 +1327,13 @@ export class GeoengineRenderer extends Component {
                 delete archInfo.activeFields[field];
             });
         }
-        const searchParams = {
-            activeFields: archInfo.activeFields,
-            resModel: model,
-            fields: fields,
-            limit: 10000,
-        };
         if (model === "geoengine.vector.layer") {
+            const searchParams = {
+                activeFields: archInfo.activeFields,
+                resModel: model,
+                fields: fields,
+                limit: 10000,
+            };
             this.vectorModel = new RelationalModel(
                 this.env,
                 searchParams,
@@ -966,10 +1341,9 @@ export class GeoengineRenderer extends Component {
             );
             await this.vectorModel.load();
         } else if (this.models.find((e) => e.model.resModel === model) === undefined) {
-            const toLoadModel = new Model(this.env, searchParams, this.services);
-            await toLoadModel.load().then(() => {
-                this.models.push({model: toLoadModel.root, archInfo});
-            });
+            // The records of the layers are read with the features of the map
+            // extent, see searchReadExtent.
+            this.models.push({model: {resModel: model, fields, records: []}, archInfo});
         }
     }
 
@@ -1000,6 +1374,13 @@ export class GeoengineRenderer extends Component {
                     model: cfg.model,
                 });
                 feature.setId(item.resId);
+                const labelPoints = this.labelPoints[cfg.resId];
+                if (labelPoints && labelPoints[item.resId]) {
+                    feature.set(
+                        "labelPoint",
+                        new ol.format.GeoJSON().readGeometry(labelPoints[item.resId])
+                    );
+                }
 
                 vectorSource.addFeature(feature);
             }
@@ -1070,12 +1451,12 @@ export class GeoengineRenderer extends Component {
             style: (feature) => {
                 const value = feature.get("attributes")[indicator];
                 const color_idx = this.getClass(value, vals);
-                var label_text = feature.values_.attributes.label;
+                var label_text = feature.get("attributes").label;
                 if (label_text === false) {
                     label_text = "";
                 }
                 console.log(feature.get("attributes").id);
-                styles_map[colors[color_idx]][0].text_.text_ = label_text.toString();
+                styles_map[colors[color_idx]][1].text_.text_ = label_text.toString();
                 return styles_map[colors[color_idx]];
             },
             legend,
@@ -1142,21 +1523,35 @@ export class GeoengineRenderer extends Component {
                 }),
                 fill: fill,
                 stroke: stroke,
+            }),
+            new ol.style.Style({
                 text: olStyleText,
+                geometry: this.getLabelGeometry,
             }),
         ];
         return {
             style: (feature) => {
-                var label_text = feature.values_.attributes.label;
+                var label_text = feature.get("attributes").label;
                 if (label_text === false) {
                     label_text = "";
                 }
-                styles[0].text_.text_ = label_text;
+                styles[1].text_.text_ = label_text;
                 return styles;
             },
             legend: "",
         };
     }
+
+    /**
+     * Labels are displayed on the label point of the feature when it is
+     * known, on its geometry otherwise.
+     * @param {*} feature
+     * @returns {ol.geom.Geometry}
+     */
+    getLabelGeometry(feature) {
+        return feature.get("labelPoint") || feature.getGeometry();
+    }
+
     createStyleText() {
         return new ol.style.Text({
             text: "",
@@ -1192,7 +1587,10 @@ export class GeoengineRenderer extends Component {
                     }),
                     fill: fill,
                     stroke: stroke,
+                }),
+                new ol.style.Style({
                     text: olStyleText,
+                    geometry: this.getLabelGeometry,
                 }),
             ];
             styles_map[color] = styles;
@@ -30,6 +30,14 @@ export const geoengineView = {
 
         return {
             ...genericProps,
+            // Geometries are serialized to GeoJSON by PostGIS and the
+            // records of geo searches on large tables are counted from the
+            // estimate of the query planner.
+            context: {
+                ...genericProps.context,
+                geo_read_postgis: true,
+                geo_approximate_count: true,
+            },
             Model: view.Model,
             Renderer: view.Renderer,
             archInfo,
@@ -13,6 +13,7 @@ class GeoModelTest(models.Model):
     geo_point = fields.GeoPoint()
     geo_multi_line = fields.GeoMultiLine()
     geo_multi_point = fields.GeoMultiPoint()
+    geo_point_wgs84 = fields.GeoPoint(srid=4326)
 
 
 class DummyZip(models.Model):
@@ -20,11 +21,17 @@ class DummyZip(models.Model):
 
     _name = "dummy.zip"
     _description = "Geoengine demo ZIP"
+    _geo_search_cache = True
 
     name = fields.Char("ZIP", index=True, required=True)
     city = fields.Char(index=True, required=True)
-    the_geom = fields.GeoMultiPolygon("NPA Shape")
+    the_geom = fields.GeoMultiPolygon(
+        "NPA Shape",
+        geo_companions=("bbox", "label_point", "area"),
+        geo_simplify_levels=(10.0, 100.0),
+    )
     the_poly = fields.GeoPolygon()
+    retail_machine_ids = fields.One2many("retail.machine", "zip_id")
 
 
 class RetailMachine(models.Model):
@@ -38,3 +45,4 @@ class RetailMachine(models.Model):
     money_level = fields.Char(index=True)
     state = fields.Selection([("hs", "HS"), ("ok", "OK")], index=True)
     name = fields.Char("Serial number", required=True)
+    zip_id = fields.Many2one("dummy.zip")
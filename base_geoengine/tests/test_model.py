@@ -1,13 +1,30 @@
 # Copyright 2023 ACSONE SA/NV
 
+import logging
+import time
+from unittest.mock import patch
+
 import geojson
+import numpy as np
+import psycopg2.extensions
+import shapely
 from odoo_test_helper import FakeModelLoader
-from shapely import wkt
+from shapely import affinity, wkb, wkt
 from shapely.geometry import shape
 
+from odoo.exceptions import UserError
 from odoo.tests.common import TransactionCase
 
-from ..fields import GeoPoint
+from .. import (
+    geo_convertion_helper as convert,
+    geo_db,
+    geo_projection,
+    geo_search_cache,
+)
+from ..fields import GeoLine, GeoPoint
+from ..models.base import METERS_PER_DEGREE, MVT_WORLD_SIZE
+
+_logger = logging.getLogger(__name__)
 
 
 class TestModel(TransactionCase):
@@ -702,3 +719,842 @@ class TestModel(TransactionCase):
             ]
         )
         self.assertEqual(len(result), 2)
+
+    def test_geo_array(self):
+        retails = self.env["retail.machine"].search([], order="name")
+        ids, geometries = retails.geo_array("the_point")
+        self.assertEqual(list(ids), retails.ids)
+        self.assertEqual(len(geometries), len(retails))
+        for rec, geometry in zip(retails, geometries):
+            self.assertTrue(geometry.equals_exact(rec.the_point, tolerance=0.0001))
+
+    def test_geo_array_empty_value(self):
+        ids, geometries = self.geo_model.geo_array("geo_polygon")
+        self.assertEqual(list(ids), self.geo_model.ids)
+        self.assertIsNone(geometries[0])
+        with self.assertRaises(ValueError):
+            self.geo_model.geo_array("name")
+
+    def test_write_ewkb_and_wkt(self):
+        """Both write encodings store the same geometry and a benchmark
+        of their throughput is logged"""
+        geometry = self.env["dummy.zip"].search([("name", "=", "1146")]).the_geom
+        records = self.env["dummy.zip"].create(
+            [{"name": str(i), "city": "Bench"} for i in range(50)]
+        )
+        field = records._fields["the_geom"]
+        convert_to_column = field.convert_to_column
+        timings = {}
+        for offset, encoding in enumerate(("ewkb", "wkt"), start=1):
+            moved = affinity.translate(geometry, xoff=offset)
+            columns = []
+
+            def spy(value, record, values=None, validate=True):
+                column = convert_to_column(value, record, values, validate)
+                columns.append(column)
+                return column
+
+            with patch.object(field, "geo_write_wkt", encoding == "wkt"), patch.object(
+                field, "convert_to_column", spy
+            ):
+                start = time.perf_counter()
+                for rec in records:
+                    rec.write({"the_geom": moved})
+                records.flush_recordset(["the_geom"])
+                timings[encoding] = time.perf_counter() - start
+            self.assertTrue(columns)
+            for column in columns:
+                if encoding == "wkt":
+                    self.assertTrue(column.startswith("SRID=3857;MULTIPOLYGON"))
+                else:
+                    self.assertIsInstance(column, shapely.Geometry)
+            records.invalidate_recordset(["the_geom"])
+            for rec in records:
+                self.assertTrue(rec.the_geom.equals_exact(moved, tolerance=0.0001))
+        _logger.info(
+            "Wrote %s multipolygons: ewkb %.3fs, wkt %.3fs",
+            len(records),
+            timings["ewkb"],
+            timings["wkt"],
+        )
+
+    def test_read_geometry_as_bytes(self):
+        retail = self.env["retail.machine"].search([("name", "=", "34")])
+        retail.invalidate_recordset(["the_point"])
+        self.assertEqual(
+            retail.the_point, wkt.loads("POINT(711341.795470746 5866150.25857961)")
+        )
+        field = retail._fields["the_point"]
+        cache_value = self.env.cache.get(retail, field)
+        self.assertIsInstance(cache_value, bytes)
+        self.assertEqual(
+            geojson.loads(retail.read(["the_point"])[0]["the_point"])["type"], "Point"
+        )
+
+    def test_geometry_typecaster_per_connection(self):
+        retail = self.env["retail.machine"].search([("name", "=", "34")])
+        retail.invalidate_recordset(["the_point"])
+        self.assertTrue(retail.the_point)
+        typecaster = geo_db._geometry_typecasters[self.env.cr.dbname]
+        for oid in typecaster.values:
+            self.assertIn(oid, self.env.cr._cnx.string_types)
+            # the oid may be another type in the other databases
+            self.assertNotIn(oid, psycopg2.extensions.string_types)
+
+    def test_sniff_format(self):
+        point = wkt.loads("POINT(1 2)")
+        values = {
+            convert.SHAPE: point,
+            convert.WKB: point.wkb,
+            convert.HEX_WKB: point.wkb_hex,
+            convert.EWKT: "SRID=3857;POINT(1 2)",
+            convert.WKT: "  POINT(1 2)",
+            convert.GEOJSON: '{"type": "Point", "coordinates": [1, 2]}',
+            convert.GEOJSON_DICT: {"type": "Point", "coordinates": [1, 2]},
+        }
+        for value_format, value in values.items():
+            self.assertEqual(convert.sniff_format(value), value_format)
+            self.assertTrue(convert.value_to_shape(value).equals(point))
+        self.assertIsNone(convert.sniff_format(12))
+        with self.assertRaises(TypeError):
+            convert.value_to_shape(12)
+
+    def test_create_point_ewkt_and_dict_format(self):
+        self.geo_model.geo_point = "SRID=3857;POINT(-99.2724609375 38.25543637637949)"
+        self.assertEqual(self.geo_model.geo_point.x, -99.2724609375)
+        self.geo_model.geo_point = {"type": "Point", "coordinates": [10, 40]}
+        self.assertTrue(self.geo_model.geo_point.equals(wkt.loads("POINT(10 40)")))
+
+    def test_read_geojson_precision(self):
+        retails = self.env["retail.machine"].search([], order="name")
+        result = retails.read(["name", "the_point"])
+        self.assertEqual([vals["id"] for vals in result], retails.ids)
+        for rec, vals in zip(retails, result):
+            self.assertEqual(vals["name"], rec.name)
+            self.assertTrue(
+                shape(geojson.loads(vals["the_point"])).equals(rec.the_point)
+            )
+        result = retails.with_context(geo_precision=2).read(["the_point"])
+        for rec, vals in zip(retails, result):
+            coordinates = geojson.loads(vals["the_point"])["coordinates"]
+            self.assertEqual(
+                coordinates, [round(rec.the_point.x, 2), round(rec.the_point.y, 2)]
+            )
+        self.assertFalse(self.geo_model.read(["geo_line"])[0]["geo_line"])
+
+    def test_geo_search_read_postgis_geojson(self):
+        retails = self.env["retail.machine"]
+        result = retails.geo_search_read([], ["name", "the_point"], order="name")
+        expected = retails.search_read([], ["name", "the_point"], order="name")
+        self.assertEqual(len(result), len(expected))
+        for vals, expected_vals in zip(result, expected):
+            self.assertEqual(vals["name"], expected_vals["name"])
+            self.assertTrue(
+                shape(geojson.loads(vals["the_point"])).equals_exact(
+                    shape(geojson.loads(expected_vals["the_point"])), tolerance=1e-6
+                )
+            )
+        result = retails.geo_search_read(
+            [("name", "=", "34")], ["the_point"], precision=1
+        )
+        self.assertEqual(
+            geojson.loads(result[0]["the_point"])["coordinates"], [711341.8, 5866150.3]
+        )
+        self.assertFalse(
+            self.geo_model.with_context(geo_read_postgis=True).read(["geo_line"])[0][
+                "geo_line"
+            ]
+        )
+
+    def test_from_to_lat_lon_many(self):
+        latitudes = [49.72842315886126, 46.5, -33.9]
+        longitudes = [5.400488376617026, 6.6, 18.4]
+        geo_points = GeoPoint.from_latlon_many(self.env.cr, latitudes, longitudes)
+        self.assertAlmostEqual(geo_points[0].x, 601179.61612, 4)
+        self.assertAlmostEqual(geo_points[0].y, 6399375.681364, 4)
+        for srid in (3857, 2056):
+            geo_points = GeoPoint.from_latlon_many(
+                self.env.cr, latitudes[:2], longitudes[:2], srid=srid
+            )
+            lons, lats = GeoPoint.to_latlon_many(self.env.cr, geo_points, srid=srid)
+            for lon, lat, longitude, latitude in zip(lons, lats, longitudes, latitudes):
+                self.assertAlmostEqual(lon, longitude, 6)
+                self.assertAlmostEqual(lat, latitude, 6)
+
+    def test_reprojection(self):
+        zip_item = self.env["dummy.zip"].search([("name", "=", "1146")])
+        for srid in (4326, "EPSG:2056"):
+            geometry = geo_projection.transform_geometries(
+                self.env.cr, [zip_item.the_geom], 3857, srid
+            )[0]
+            self.env.cr.execute(
+                "SELECT ST_Transform(the_geom, %s) FROM dummy_zip WHERE id = %s",
+                (geo_projection.parse_srid(srid), zip_item.id),
+            )
+            expected = wkb.loads(bytes(self.env.cr.fetchone()[0]))
+            self.assertTrue(geometry.equals_exact(expected, tolerance=0.001))
+        ids, geometries = zip_item.geo_array("the_geom", srid="EPSG:2056")
+        self.assertTrue(geometries[0].equals_exact(expected, tolerance=0.001))
+
+    def test_line_from_points(self):
+        line = GeoLine.from_points(
+            self.env.cr, wkt.loads("POINT(0 0)"), wkt.loads("POINT(1 1)")
+        )
+        self.assertEqual(line.wkt, "LINESTRING (0 0, 1 1)")
+
+    def test_geo_companions(self):
+        zip_item = self.env["dummy.zip"].search([("name", "=", "1146")])
+        self.env.cr.execute(
+            """
+            SELECT the_geom_area, ST_AsText(the_geom_bbox),
+                ST_AsText(the_geom_label_point)
+            FROM dummy_zip WHERE id = %s
+            """,
+            (zip_item.id,),
+        )
+        area, bbox, label_point = self.env.cr.fetchone()
+        self.assertAlmostEqual(area, zip_item.the_geom.area, 2)
+        self.assertTrue(wkt.loads(bbox).equals(zip_item.the_geom.envelope))
+        self.assertTrue(zip_item.the_geom.contains(wkt.loads(label_point)))
+        # companions are kept up to date on write
+        zip_item.the_geom = "MULTIPOLYGON (((0 0, 0 5, 5 5, 5 0, 0 0)))"
+        zip_item.flush_recordset()
+        result = self.env["dummy.zip"].search(
+            [("id", "=", zip_item.id), ("the_geom", "geo_greater", 24.0)]
+        )
+        self.assertEqual(result, zip_item)
+        result = self.env["dummy.zip"].search(
+            [("id", "=", zip_item.id), ("the_geom", "geo_greater", 26.0)]
+        )
+        self.assertFalse(result)
+        self.assertEqual(
+            self.env["dummy.zip"].geo_extent("the_geom", [("id", "=", zip_item.id)]),
+            [0.0, 0.0, 5.0, 5.0],
+        )
+        label_points = zip_item.geo_label_points("the_geom")
+        self.assertTrue(
+            zip_item.the_geom.contains(shape(geojson.loads(label_points[zip_item.id])))
+        )
+
+    def test_geo_extent_without_companion(self):
+        retail_machines = self.env["retail.machine"].search([])
+        extent = retail_machines.geo_extent("the_point")
+        xs = [machine.the_point.x for machine in retail_machines]
+        ys = [machine.the_point.y for machine in retail_machines]
+        for value, expected in zip(extent, [min(xs), min(ys), max(xs), max(ys)]):
+            self.assertAlmostEqual(value, expected, 2)
+        self.assertFalse(retail_machines.geo_extent("the_point", [("id", "=", 0)]))
+
+    def test_search_dwithin(self):
+        retail_machines = self.env["retail.machine"].search([])
+        zip_item = self.env["dummy.zip"].search([("name", "=", "1146")])
+        for distance in (0, 1000, 10000):
+            expected = retail_machines.filtered(
+                lambda machine: machine.the_point.distance(zip_item.the_geom)
+                <= distance
+            )
+            result = retail_machines.search(
+                [("the_point", "geo_dwithin", (zip_item.the_geom, distance))]
+            )
+            self.assertEqual(result, expected)
+            result = retail_machines.search(
+                [
+                    (
+                        "the_point",
+                        "geo_dwithin",
+                        [{"dummy.zip.the_geom": [("id", "=", zip_item.id)]}, distance],
+                    )
+                ]
+            )
+            self.assertEqual(result, expected)
+
+    def test_search_dwithin_wgs84(self):
+        model = self.env["geo.model.test"]
+        origin = model.create({"geo_point_wgs84": "POINT(6.6 46.5)"})
+        # about 445 m north and 1530 m east of origin
+        north = model.create({"geo_point_wgs84": "POINT(6.6 46.504)"})
+        east = model.create({"geo_point_wgs84": "POINT(6.62 46.5)"})
+        records = origin | north | east
+        for distance, expected in (
+            (400, origin),
+            (500, origin | north),
+            (1600, origin | north | east),
+        ):
+            result = model.search(
+                [
+                    ("id", "in", records.ids),
+                    ("geo_point_wgs84", "geo_dwithin", ("POINT(6.6 46.5)", distance)),
+                ]
+            )
+            self.assertEqual(result, expected)
+            result = model.search(
+                [
+                    ("id", "in", records.ids),
+                    (
+                        "geo_point_wgs84",
+                        "geo_dwithin",
+                        (
+                            {
+                                "geo.model.test.geo_point_wgs84": [
+                                    ("id", "=", origin.id)
+                                ]
+                            },
+                            distance,
+                        ),
+                    ),
+                ]
+            )
+            self.assertEqual(result, expected)
+        with self.assertRaises(ValueError):
+            model.search([("geo_point_wgs84", "geo_dwithin", "POINT(6.6 46.5)")])
+
+    def test_geo_nearest(self):
+        retail_machine = self.env["retail.machine"]
+        origin = "POINT(709000 5873000)"
+        point = wkt.loads(origin)
+        machines = retail_machine.search([])
+        expected = machines.sorted(lambda machine: machine.the_point.distance(point))
+        self.assertEqual(
+            retail_machine.geo_nearest("the_point", origin, limit=None), expected
+        )
+        self.assertEqual(
+            retail_machine.geo_nearest("the_point", origin, limit=2, offset=1),
+            expected[1:3],
+        )
+        self.assertEqual(
+            retail_machine.geo_nearest(
+                "the_point", origin, domain=[("name", "!=", expected[0].name)]
+            )[:1],
+            expected[1],
+        )
+        nearest = retail_machine.geo_nearest(
+            "the_point", origin, limit=3, distance=True
+        )
+        self.assertEqual([record.id for record, distance in nearest], expected[:3].ids)
+        for record, distance in nearest:
+            self.assertAlmostEqual(distance, record.the_point.distance(point), 4)
+        # the order can be reversed
+        result = retail_machine.with_context(geo_distance_from=point).search(
+            [], order="the_point:distance desc"
+        )
+        self.assertEqual(result, expected[::-1])
+        with self.assertRaises(ValueError):
+            retail_machine.search([], order="the_point:distance")
+
+    def test_geo_join(self):
+        machines = self.env["retail.machine"].search([])
+        zips = self.env["dummy.zip"].search([])
+        result = machines.geo_join(
+            "the_point", "dummy.zip", "the_geom", operator="geo_within"
+        )
+        self.assertEqual(set(result), set(machines.ids))
+        for machine in machines:
+            expected = zips.filtered(
+                lambda zip_item: zip_item.the_geom.contains(machine.the_point)
+            )
+            self.assertEqual(result[machine.id], expected)
+        # the domain of the comodel is applied
+        result = machines.geo_join(
+            "the_point", "dummy.zip", "the_geom", domain=[("id", "=", 0)]
+        )
+        self.assertFalse(any(result.values()))
+        result = machines.geo_join(
+            "the_point", "retail.machine", "the_point", nearest=2
+        )
+        for machine in machines:
+            expected = machines.sorted(
+                lambda other: (other.the_point.distance(machine.the_point), other.id)
+            )[:2]
+            self.assertEqual(result[machine.id], expected)
+            self.assertEqual(result[machine.id][0], machine)
+        with self.assertRaises(ValueError):
+            machines.geo_join(
+                "the_point", "dummy.zip", "the_geom", operator="geo_lesser"
+            )
+
+    def test_geo_aggregate(self):
+        machines = self.env["retail.machine"].search([])
+        zips = self.env["dummy.zip"].search([])
+        aggregates = ["total_sales:sum", "id:count", "total_sales:max"]
+        result = zips.geo_aggregate(
+            "the_geom", "retail.machine", "the_point", aggregates
+        )
+        self.assertEqual(set(result), set(zips.ids))
+        for zip_item in zips:
+            matches = machines.filtered(
+                lambda machine: zip_item.the_geom.intersects(machine.the_point)
+            )
+            values = result[zip_item.id]
+            self.assertEqual(values["id:count"], len(matches))
+            if matches:
+                self.assertAlmostEqual(
+                    values["total_sales:sum"], sum(matches.mapped("total_sales"))
+                )
+                self.assertEqual(
+                    values["total_sales:max"], max(matches.mapped("total_sales"))
+                )
+            else:
+                self.assertIsNone(values["total_sales:sum"])
+        with self.assertRaises(ValueError):
+            zips.geo_aggregate(
+                "the_geom", "retail.machine", "the_point", ["total_sales:median"]
+            )
+
+    def test_read_group_geo_aggregates(self):
+        retail_machine = self.env["retail.machine"]
+        groups = retail_machine.read_group(
+            [],
+            [
+                "the_point:extent",
+                "points:collect(the_point)",
+                "merged:union(the_point)",
+                "center:centroid(the_point)",
+                "located:count_in(the_point)",
+                "total_sales:sum",
+            ],
+            ["money_level"],
+        )
+        self.assertEqual(len(groups), 2)
+        for group in groups:
+            machines = retail_machine.search(group["__domain"])
+            points = [machine.the_point for machine in machines]
+            collection = shapely.multipoints(points)
+            self.assertEqual(group["located"], len(machines))
+            for value, expected in zip(group["the_point"], collection.bounds):
+                self.assertAlmostEqual(value, expected, 4)
+            self.assertTrue(shape(geojson.loads(group["points"])).equals(collection))
+            self.assertTrue(shape(geojson.loads(group["merged"])).equals(collection))
+            self.assertTrue(
+                shape(geojson.loads(group["center"])).equals_exact(
+                    collection.centroid, tolerance=0.001
+                )
+            )
+        # empty geometries are not counted
+        machine = retail_machine.search([], limit=1)
+        self.env.cr.execute(
+            "UPDATE retail_machine SET the_point = 'SRID=3857;POINT EMPTY' WHERE id = %s",
+            (machine.id,),
+        )
+        groups = retail_machine.read_group(
+            [("id", "=", machine.id)], ["located:count_in(the_point)"], []
+        )
+        self.assertEqual(groups[0]["located"], 0)
+        # the geo aggregate functions are not valid for the other fields
+        with self.assertRaises(UserError):
+            retail_machine.read_group([], ["name:st_union"], ["money_level"])
+
+    def test_geo_domain_sql_is_stable(self):
+        retail_machine = self.env["retail.machine"]
+        zip_item = self.env["dummy.zip"].search([("name", "=", "1146")])
+
+        def compile_domain(domain):
+            return retail_machine._where_calc(domain).select()
+
+        for domain in (
+            [("the_point", "geo_intersect", zip_item.the_geom)],
+            [("the_point", "geo_equal", "POINT(708451.36372351 5872547.88349207)")],
+            [
+                (
+                    "the_point",
+                    "geo_intersect",
+                    {"dummy.zip.the_geom": [("id", "=", zip_item.id)]},
+                )
+            ],
+        ):
+            query, params = compile_domain(domain)
+            self.assertEqual(compile_domain(domain), (query, params))
+            self.assertNotIn("ST_GeomFromText", query)
+        # the geometry is a parameter, the query only depends on the domain
+        query, params = compile_domain(
+            [("the_point", "geo_within", "POLYGON((0 0, 0 1, 1 1, 0 0))")]
+        )
+        other_query, other_params = compile_domain(
+            [("the_point", "geo_within", "POLYGON((0 0, 0 2, 2 2, 0 0))")]
+        )
+        self.assertEqual(query, other_query)
+        self.assertNotEqual(params, other_params)
+        self.assertIn("ST_GeomFromEWKB", query)
+        # the srid of the field is sent with the geometry
+        equal = retail_machine.search(
+            [("the_point", "geo_equal", "POINT(708451.36372351 5872547.88349207)")]
+        )
+        self.assertEqual(equal.name, "18")
+
+    def test_search_subdivided_geometry(self):
+        retail_machine = self.env["retail.machine"]
+        zip_item = self.env["dummy.zip"].search([("name", "=", "1146")])
+        circle = shapely.Point(709000, 5873000).buffer(2000, quad_segs=256)
+        config = self.env["ir.config_parameter"].sudo()
+        for geometry in (zip_item.the_geom, circle):
+            expected = {}
+            for max_vertices in ("0", "8"):
+                config.set_param("base_geoengine.subdivide_max_vertices", max_vertices)
+                for operator in ("geo_intersect", "geo_within"):
+                    domain = [("the_point", operator, geometry)]
+                    query, params = retail_machine._where_calc(domain).select()
+                    self.assertEqual("unnest(ARRAY(" in query, max_vertices == "8")
+                    result = retail_machine.search(domain)
+                    expected.setdefault(operator, result)
+                    self.assertEqual(result, expected[operator])
+            self.assertTrue(expected["geo_intersect"])
+        pieces = convert.subdivide(circle, 64)
+        self.assertTrue(
+            all(shapely.get_num_coordinates(piece) <= 64 for piece in pieces)
+        )
+        self.assertAlmostEqual(shapely.union_all(pieces).area, circle.area, 2)
+
+    def test_search_subdivided_concave_geometry(self):
+        retail_machine = self.env["retail.machine"]
+        machines = retail_machine.search([])
+        points = shapely.multipoints([machine.the_point for machine in machines])
+        minx, miny, maxx, maxy = points.bounds
+        size = max(maxx - minx, maxy - miny)
+        # the branches of a star leave some machines outside
+        angles = np.linspace(0, 2 * np.pi, 81)[:-1]
+        radii = np.where(np.arange(80) % 2, size / 8, size / 2)
+        star = shapely.Polygon(
+            np.column_stack(
+                [
+                    points.centroid.x + radii * np.cos(angles),
+                    points.centroid.y + radii * np.sin(angles),
+                ]
+            )
+        )
+        config = self.env["ir.config_parameter"].sudo()
+        for operator, predicate in (
+            ("geo_intersect", star.intersects),
+            ("geo_within", star.contains),
+        ):
+            expected = machines.filtered(lambda m: predicate(m.the_point))
+            for max_vertices in ("0", "8"):
+                config.set_param("base_geoengine.subdivide_max_vertices", max_vertices)
+                result = retail_machine.search([("the_point", operator, star)])
+                self.assertEqual(result, expected)
+        self.assertTrue(all(piece.is_valid for piece in convert.subdivide(star, 8)))
+
+    def test_search_on_related_geo_field(self):
+        retail_machine = self.env["retail.machine"]
+        dummy_zip = self.env["dummy.zip"]
+        zip_item = dummy_zip.search([("name", "=", "1146")])
+        machines = retail_machine.search([])
+        inside = machines.filtered(
+            lambda machine: zip_item.the_geom.contains(machine.the_point)
+        )
+        self.assertTrue(inside)
+        inside.zip_id = zip_item
+        point = inside[0].the_point
+        # many2one
+        result = retail_machine.search([("zip_id.the_geom", "geo_contains", point)])
+        self.assertEqual(result, inside)
+        result = retail_machine.search(
+            ["!", ("zip_id.the_geom", "geo_contains", point)]
+        )
+        self.assertEqual(result, machines - inside)
+        # one2many
+        result = dummy_zip.search(
+            [("retail_machine_ids.the_point", "geo_within", zip_item.the_geom)]
+        )
+        self.assertEqual(result, zip_item)
+        result = dummy_zip.search(
+            [("retail_machine_ids.the_point", "geo_dwithin", (point, 0))]
+        )
+        self.assertEqual(result, zip_item)
+        # longer paths
+        result = retail_machine.search(
+            [("zip_id.retail_machine_ids.the_point", "geo_equal", point)]
+        )
+        self.assertEqual(result, inside)
+
+    def test_geo_search_cache(self):
+        dummy_zip = self.env["dummy.zip"]
+        zip_item = dummy_zip.search([("name", "=", "1146")])
+        domain = [("the_geom", "geo_intersect", zip_item.the_geom.centroid)]
+        self.assertEqual(dummy_zip.search(domain), zip_item)
+        with self.assertQueryCount(0):
+            self.assertEqual(dummy_zip.search(domain), zip_item)
+            self.assertEqual(dummy_zip.search(domain, count=True), 1)
+        # searches without a geo operator are not cached
+        self.assertIsNone(
+            dummy_zip._geo_search_cache_key([("name", "=", "1146")], 0, None, None, 0)
+        )
+        # nor the ones depending on models that do not use the cache
+        self.assertIsNone(
+            dummy_zip._geo_search_cache_key(
+                [("the_geom", "geo_contains", {"retail.machine.the_point": []})],
+                0,
+                None,
+                None,
+                False,
+            )
+        )
+        # the records were created in the transaction, the result is only
+        # cached for it
+        key = dummy_zip._geo_search_cache_key(domain, 0, None, None, False)
+        state = geo_search_cache.get_transaction_state(self.env.cr)
+        self.assertIn(key, state["local"].entries)
+        self.assertNotIn(key, geo_search_cache.get_cache(self.env.registry).entries)
+        self.assertNotEqual(
+            key,
+            dummy_zip.with_context(lang="fr_FR")._geo_search_cache_key(
+                domain, 0, None, None, False
+            ),
+        )
+        zip_item.the_geom = shapely.Point(0, 0).buffer(1)
+        self.assertNotIn(key, state["local"].entries)
+        self.assertFalse(dummy_zip.search(domain))
+
+    def test_geo_search_cache_invalidation(self):
+        cache = geo_search_cache.GeoSearchCache()
+        sequences = {
+            geo_search_cache.signaling_sequence("dummy_zip"): 1,
+            geo_search_cache.signaling_sequence("retail_machine"): 1,
+        }
+        cache.put("zip", (1,), {"dummy_zip"}, sequences)
+        cache.put("both", (2,), {"dummy_zip", "retail_machine"}, sequences)
+        cache.put("machine", (3,), {"retail_machine"}, sequences)
+        cache.invalidate({"retail_machine"})
+        self.assertEqual(list(cache.entries), ["zip"])
+        # the table was changed by another worker
+        sequences[geo_search_cache.signaling_sequence("dummy_zip")] = 2
+        self.assertIsNone(cache.get("zip", {"dummy_zip"}, sequences))
+        # the results of transactions that saw an older signal are not kept
+        sequences[geo_search_cache.signaling_sequence("dummy_zip")] = 1
+        cache.put("zip", (1,), {"dummy_zip"}, sequences)
+        self.assertFalse(cache.entries)
+
+    def test_geo_search_count(self):
+        dummy_zip = self.env["dummy.zip"]
+        zip_item = dummy_zip.search([("name", "=", "1146")])
+        domain = [("the_geom", "geo_intersect", zip_item.the_geom.centroid)]
+        self.assertEqual(
+            dummy_zip.geo_search_count(domain), {"count": 1, "approximate": False}
+        )
+        self.env.cr.execute("ANALYZE dummy_zip")
+        self.env["ir.config_parameter"].sudo().set_param(
+            "base_geoengine.approximate_count_threshold", "1"
+        )
+        result = dummy_zip.geo_search_count(domain)
+        self.assertTrue(result["approximate"])
+        self.assertIsInstance(result["count"], int)
+        self.assertEqual(
+            dummy_zip.geo_search_count(domain, exact=True),
+            {"count": 1, "approximate": False},
+        )
+        # searches without a geo operator are always counted
+        self.assertFalse(
+            dummy_zip.geo_search_count([("name", "=", "1146")])["approximate"]
+        )
+        result = dummy_zip.with_context(geo_approximate_count=True).web_search_read(
+            domain, ["name"], limit=1
+        )
+        self.assertEqual(result["records"][0]["id"], zip_item.id)
+        self.assertTrue(result["approximate_count"])
+        result = dummy_zip.with_context(geo_approximate_count=True).web_search_read(
+            domain, ["name"], limit=2
+        )
+        self.assertFalse(result["approximate_count"])
+        self.assertEqual(result["length"], 1)
+
+    def test_geo_tile(self):
+        dummy_zip = self.env["dummy.zip"]
+        zip_item = dummy_zip.search([("name", "=", "1146")])
+        point = zip_item.the_geom.representative_point()
+        z = 12
+        tile_size = MVT_WORLD_SIZE / 2**z
+        x = int((point.x + MVT_WORLD_SIZE / 2) // tile_size)
+        y = int((MVT_WORLD_SIZE / 2 - point.y) // tile_size)
+        tile = dummy_zip.geo_tile("the_geom", z, x, y, attribute_field_name="name")
+        self.assertIn(b"1146", tile)
+        tile = dummy_zip.geo_tile(
+            "the_geom",
+            z,
+            x,
+            y,
+            domain=[("id", "!=", zip_item.id)],
+            attribute_field_name="name",
+        )
+        self.assertNotIn(b"1146", tile)
+        self.assertEqual(dummy_zip.geo_tile("the_geom", z, 0, 0), b"")
+        with self.assertRaises(ValueError):
+            dummy_zip.geo_tile("the_geom", z, 2**z, 0)
+        with self.assertRaises(ValueError):
+            dummy_zip.geo_tile(
+                "the_geom", z, x, y, attribute_field_name="retail_machine_ids"
+            )
+
+    def test_geo_tile_cache(self):
+        dummy_zip = self.env["dummy.zip"]
+        zip_item = dummy_zip.search([("name", "=", "1146")])
+        view = self.env["ir.ui.view"].create(
+            {
+                "name": "dummy.zip.geoengine",
+                "model": "dummy.zip",
+                "type": "geoengine",
+                "arch": '<geoengine><field name="name" /></geoengine>',
+            }
+        )
+        layer = self.env["geoengine.vector.layer"].create(
+            {
+                "name": "ZIP",
+                "geo_repr": "basic",
+                "view_id": view.id,
+                "geo_field_id": self.env["ir.model.fields"]
+                ._get("dummy.zip", "the_geom")
+                .id,
+                "attribute_field_id": self.env["ir.model.fields"]
+                ._get("dummy.zip", "name")
+                .id,
+                "use_vector_tiles": True,
+                "use_tile_cache": True,
+            }
+        )
+        self.assertEqual(dummy_zip._geo_tile_cache_fields(), ("the_geom",))
+        cache = self.env["geoengine.tile.cache"]
+        geometry = zip_item.the_geom
+        point = zip_item.the_geom.representative_point()
+        z = 12
+        tile_size = MVT_WORLD_SIZE / 2**z
+        x = int((point.x + MVT_WORLD_SIZE / 2) // tile_size)
+        y = int((MVT_WORLD_SIZE / 2 - point.y) // tile_size)
+        tile = cache.get_tile(layer, z, x, y)
+        self.assertIn(b"1146", tile)
+        self.assertEqual(cache.search_count([("layer_id", "=", layer.id)]), 1)
+        with self.assertQueryCount(1):
+            self.assertEqual(cache.get_tile(layer, z, x, y), tile)
+        # a record far from the tile does not invalidate it
+        null_island = shapely.MultiPolygon([shapely.Point(0, 0).buffer(1)])
+        dummy_zip.create(
+            {"name": "0000", "city": "Null Island", "the_geom": null_island}
+        )
+        self.assertEqual(cache.search_count([("layer_id", "=", layer.id)]), 1)
+        # the tiles are dropped when the change is flushed
+        zip_item.the_geom = null_island
+        self.assertNotIn(b"1146", cache.get_tile(layer, z, x, y))
+        self.assertEqual(cache.search_count([("layer_id", "=", layer.id)]), 1)
+        # computed geometries are flushed by _write, without write
+        zip_item._write(
+            {
+                "the_geom": zip_item._fields["the_geom"].convert_to_column(
+                    geometry, zip_item
+                )
+            }
+        )
+        self.assertFalse(cache.search_count([("layer_id", "=", layer.id)]))
+        self.assertTrue(layer.seed_tiles(max_zoom=2))
+
+    def test_geo_search_read_bbox(self):
+        dummy_zip = self.env["dummy.zip"]
+        zip_item = dummy_zip.search([("name", "=", "1146")])
+        bbox = list(zip_item.the_geom.bounds)
+        result = dummy_zip.geo_search_read_bbox("the_geom", bbox, fields=["name"])
+        self.assertIn(zip_item.id, [values["id"] for values in result])
+        result = dummy_zip.geo_search_read_bbox(
+            "the_geom", bbox, domain=[("name", "!=", "1146")], fields=["name"]
+        )
+        self.assertNotIn(zip_item.id, [values["id"] for values in result])
+        # the bounding box may be given in another SRID
+        xs, ys = geo_projection.transform_coordinates(
+            self.env.cr, bbox[0::2], bbox[1::2], 3857, 4326
+        )
+        result = dummy_zip.geo_search_read_bbox(
+            "the_geom",
+            [xs[0], ys[0], xs[1], ys[1]],
+            fields=["name", "the_geom"],
+            bbox_srid="EPSG:4326",
+        )
+        self.assertIn(zip_item.id, [values["id"] for values in result])
+        # the records are paged by id
+        result = dummy_zip.geo_search_read_bbox(
+            "the_geom", [-1e7, -1e7, 1e7, 1e7], fields=["name"]
+        )
+        ids = [values["id"] for values in result]
+        self.assertEqual(ids, sorted(ids))
+        result = dummy_zip.geo_search_read_bbox(
+            "the_geom", [-1e7, -1e7, 1e7, 1e7], fields=["name"], offset=1, limit=1
+        )
+        self.assertEqual([values["id"] for values in result], ids[1:2])
+
+    def test_read_simplified_geometries(self):
+        circle = shapely.Point(709000, 5873000).buffer(2000, quad_segs=16)
+        self.geo_model.geo_polygon = circle
+
+        def read_coordinates(**context):
+            value = self.geo_model.with_context(**context).read(["geo_polygon"])
+            return shapely.get_num_coordinates(
+                shapely.from_geojson(value[0]["geo_polygon"])
+            )
+
+        full = read_coordinates()
+        self.assertEqual(full, shapely.get_num_coordinates(circle))
+        for postgis in (False, True):
+            # at zoom 5 a pixel is about 5km wide
+            self.assertLess(
+                read_coordinates(geo_read_postgis=postgis, geo_zoom=5), full / 10
+            )
+            self.assertEqual(
+                read_coordinates(geo_read_postgis=postgis, geo_zoom=20), full
+            )
+            self.assertLess(
+                read_coordinates(geo_read_postgis=postgis, geo_simplify_tolerance=100),
+                full,
+            )
+        # the resolution may be given in degrees
+        tolerance = (
+            self.env["geo.model.test"]
+            .with_context(geo_resolution=0.01, geo_resolution_srid="EPSG:4326")
+            ._get_geo_simplify_tolerance(self.geo_model._fields["geo_polygon"])
+        )
+        self.assertAlmostEqual(tolerance, 0.01 * METERS_PER_DEGREE / 2)
+
+    def test_geo_simplify_levels(self):
+        zip_item = self.env["dummy.zip"].search([("name", "=", "1146")])
+        self.env.cr.execute(
+            """
+            SELECT indexname FROM pg_indexes
+            WHERE tablename = 'dummy_zip' AND indexname LIKE %s
+            """,
+            ("%_simplified_%",),
+        )
+        self.assertEqual(
+            sorted(row[0] for row in self.env.cr.fetchall()),
+            [
+                "dummy_zip_the_geom_simplified_100_index",
+                "dummy_zip_the_geom_simplified_10_index",
+            ],
+        )
+        # the bump of 50 on the top side is lost by the level 100
+        zip_item.the_geom = (
+            "MULTIPOLYGON (((0 0, 0 1000, 500 1050, 1000 1000, 1000 0, 0 0)))"
+        )
+        zip_item.flush_recordset()
+
+        def read_coordinates(**context):
+            value = zip_item.with_context(**context).read(["the_geom"])
+            return shapely.get_num_coordinates(
+                shapely.from_geojson(value[0]["the_geom"])
+            )
+
+        self.assertEqual(read_coordinates(), 6)
+        self.assertEqual(read_coordinates(geo_simplify_tolerance=100), 5)
+        # read from the level 10 and simplified further
+        self.assertEqual(read_coordinates(geo_simplify_tolerance=20), 6)
+        self.assertEqual(read_coordinates(geo_simplify_tolerance=500), 5)
+
+        def search(**context):
+            return (
+                self.env["dummy.zip"]
+                .with_context(**context)
+                .search(
+                    [
+                        ("id", "=", zip_item.id),
+                        ("the_geom", "geo_intersect", "POINT (500 1020)"),
+                    ]
+                )
+            )
+
+        self.assertEqual(search(), zip_item)
+        self.assertEqual(search(geo_simplify_tolerance=50), zip_item)
+        self.assertFalse(search(geo_simplify_tolerance=100))
+        # the level stored for the zoom 6 is the level 100
+        self.assertFalse(search(geo_zoom=6))
+        self.assertEqual(search(geo_zoom=16), zip_item)
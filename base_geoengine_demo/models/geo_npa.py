@@ -10,11 +10,16 @@ class NPA(models.Model):
 
     _name = "dummy.zip"
     _description = "Geoengine demo ZIP"
+    _geo_search_cache = True
 
     priority = fields.Integer(default=100)
     name = fields.Char("ZIP", index=True, required=True)
     city = fields.Char(index=True, required=True)
-    the_geom = fields.GeoMultiPolygon("NPA Shape")
+    the_geom = fields.GeoMultiPolygon(
+        "NPA Shape",
+        geo_companions=("bbox", "label_point", "area"),
+        geo_simplify_levels=(10.0, 100.0),
+    )
     # the_geom_poly = fields.GeoPolygon()
     # the_geom_multiLine = fields.GeoMultiLine()
     # the_geom_multipoint = fields.GeoMultiPoint()
@@ -30,32 +35,14 @@ class NPA(models.Model):
 
     def _compute_ZIP_total_sales(self):
         """Return the total of the invoiced sales for this npa"""
-        mach_obj = self.env["geoengine.demo.automatic.retailing.machine"]
+        totals = self.geo_aggregate(
+            "the_geom",
+            "geoengine.demo.automatic.retailing.machine",
+            "the_point",
+            ["total_sales:sum"],
+        )
         for rec in self:
-            res = mach_obj.search(
-                [
-                    (
-                        "the_point",
-                        "geo_intersect",
-                        {"dummy.zip.the_geom": [("id", "=", rec.id)]},
-                    )
-                ]
-            )
-            cursor = self.env.cr
-            if res.ids:
-                cursor.execute(
-                    "SELECT sum(total_sales) from"
-                    " geoengine_demo_automatic_retailing_machine "
-                    "where id in %s;",
-                    (tuple(res.ids),),
-                )
-                res = cursor.fetchone()
-                if res:
-                    rec.total_sales = res[0] or 0.0
-                else:
-                    rec.total_sales = 0.0
-            else:
-                rec.total_sales = 0.0
+            rec.total_sales = totals[rec.id]["total_sales:sum"] or 0.0
 
     def name_get(self):
         res = []
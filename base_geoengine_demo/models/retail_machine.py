@@ -25,27 +25,23 @@ class RetailMachine(models.Model):
     @api.constrains("the_point", "zip_id")
     def _check_the_point(self):
         """Check if the point is place in the corresponding area."""
-        if self.the_point and self.zip_id:
-            for rec in self:
-                zip_match = (
-                    self.env["dummy.zip"]
-                    .search(
-                        [
-                            ("id", "=", self.zip_id.id),
-                            ("the_geom", "geo_contains", rec.the_point),
-                        ],
-                        limit=1,
+        records = self.filtered(lambda rec: rec.the_point and rec.zip_id)
+        zips = records.geo_join(
+            "the_point",
+            "dummy.zip",
+            "the_geom",
+            domain=[("id", "in", records.zip_id.ids)],
+            operator="geo_within",
+        )
+        for rec in records:
+            if rec.zip_id not in zips[rec.id]:
+                raise ValidationError(
+                    _(
+                        "The point must be placed in the corresponding "
+                        + "area. (serial number: %s).",
+                        rec.name,
                     )
-                    .ids
                 )
-                if not zip_match:
-                    raise ValidationError(
-                        _(
-                            "The point must be placed in the corresponding "
-                            + "area. (serial number: %s).",
-                            rec.name,
-                        )
-                    )
 
     @api.depends("the_point")
     def _compute_zip_id(self):
@@ -53,14 +49,8 @@ class RetailMachine(models.Model):
         Lookup in zips if the code is within an area.
         Change the zip_id field accordingly
         """
+        zips = self.geo_join(
+            "the_point", "dummy.zip", "the_geom", operator="geo_within"
+        )
         for rec in self:
-            if rec.the_point:
-                zip_match = (
-                    self.env["dummy.zip"]
-                    .search([("the_geom", "geo_contains", rec.the_point)], limit=1)
-                    .ids
-                )
-                if zip_match:
-                    rec.zip_id = zip_match[0]
-            else:
-                rec.zip_id = 0
+            rec.zip_id = zips[rec.id][:1]
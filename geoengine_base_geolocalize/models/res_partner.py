@@ -3,6 +3,10 @@
 
 from odoo import api, fields, models
 
+# above this number of records, geo_point and its inverse are computed with
+# a single UPDATE query instead of going through the ORM
+GEO_POINT_BULK_THRESHOLD = 500
+
 
 class ResPartner(models.Model):
     """Add geo_point to partner using a function field"""
@@ -18,24 +22,144 @@ class ResPartner(models.Model):
         If one of those parameters is not set then reset the partner's
         geo_point and do not recompute it
         """
-        for rec in self:
-            if not rec.partner_latitude or not rec.partner_longitude:
-                rec.geo_point = False
-            else:
-                rec.geo_point = fields.GeoPoint.from_latlon(
-                    rec.env.cr, rec.partner_latitude, rec.partner_longitude
-                )
+        located = self.filtered(
+            lambda rec: rec.partner_latitude and rec.partner_longitude
+        )
+        (self - located).geo_point = False
+        if len(located) > GEO_POINT_BULK_THRESHOLD and all(located._ids):
+            located._update_geo_point_from_latlon()
+            return
+        geo_points = fields.GeoPoint.from_latlon_many(
+            self.env.cr,
+            located.mapped("partner_latitude"),
+            located.mapped("partner_longitude"),
+        )
+        for rec, geo_point in zip(located, geo_points):
+            rec.geo_point = geo_point
 
     geo_point = fields.GeoPoint(
         store=True, compute="_compute_geo_point", inverse="_inverse_geo_point"
     )
 
     def _inverse_geo_point(self):
-        for rec in self:
-            if not rec.geo_point:
-                rec.partner_longitude, rec.partner_latitude = False, False
-            else:
-                (
-                    rec.partner_longitude,
-                    rec.partner_latitude,
-                ) = fields.GeoPoint.to_latlon(rec.env.cr, rec.geo_point)
+        located = self.filtered("geo_point")
+        (self - located).update({"partner_longitude": False, "partner_latitude": False})
+        if len(located) > GEO_POINT_BULK_THRESHOLD and all(located._ids):
+            located._update_latlon_from_geo_point()
+            return
+        longitudes, latitudes = fields.GeoPoint.to_latlon_many(
+            self.env.cr, located.mapped("geo_point")
+        )
+        for rec, longitude, latitude in zip(located, longitudes, latitudes):
+            rec.update(
+                {
+                    "partner_longitude": float(longitude),
+                    "partner_latitude": float(latitude),
+                }
+            )
+
+    def _update_geo_point_from_latlon(self):
+        """Set the geo_point of all the partners from their latitude and
+        longitude with a single UPDATE, and put the result in cache"""
+        field = self._fields["geo_point"]
+        self.flush_recordset(["write_uid", "write_date"])
+        tile_cache_fields = [
+            name for name in self._geo_tile_cache_fields() if name == "geo_point"
+        ]
+        # the UPDATE bypasses _write, the tiles of the old geo points are
+        # dropped before it and the ones of the new geo points after
+        if tile_cache_fields:
+            self.env["geoengine.tile.cache"]._invalidate_records(
+                self, tile_cache_fields
+            )
+        # pylint: disable=E8103
+        self.env.cr.execute(
+            f"""
+            UPDATE "{self._table}" AS p
+            SET
+                geo_point = ST_Transform(
+                    ST_SetSRID(ST_MakePoint(u.lon, u.lat), 4326), %(srid)s
+                ),
+                write_uid = %(uid)s,
+                write_date = %(now)s
+            FROM unnest(%(ids)s::integer[], %(lons)s::float8[], %(lats)s::float8[])
+                AS u(id, lon, lat)
+            WHERE p.id = u.id
+            RETURNING p.id, p.geo_point
+            """,
+            {
+                "srid": field.srid,
+                "ids": self.ids,
+                "lons": self.mapped("partner_longitude"),
+                "lats": self.mapped("partner_latitude"),
+                "uid": self.env.uid,
+                "now": self.env.cr.now(),
+            },
+        )
+        geo_points = dict(self.env.cr.fetchall())
+        self.env.cache.update(
+            self,
+            field,
+            [field.convert_to_cache(geo_points[rec.id], rec) for rec in self],
+        )
+        self._invalidate_geo_caches(tile_cache_fields)
+
+    def _update_latlon_from_geo_point(self):
+        """Set the latitude and longitude of all the partners from their
+        geo_point with a single UPDATE, and put the result in cache"""
+        # the pending values would overwrite the result of the UPDATE
+        self.flush_recordset(
+            [
+                "geo_point",
+                "partner_longitude",
+                "partner_latitude",
+                "write_uid",
+                "write_date",
+            ]
+        )
+        # pylint: disable=E8103
+        self.env.cr.execute(
+            f"""
+            UPDATE "{self._table}" AS p
+            SET partner_longitude = ST_X(g.geom),
+                partner_latitude = ST_Y(g.geom),
+                write_uid = %s,
+                write_date = %s
+            FROM (
+                SELECT id, ST_Transform(geo_point, 4326) AS geom
+                FROM "{self._table}"
+                WHERE id = ANY(%s)
+            ) AS g
+            WHERE p.id = g.id
+            RETURNING p.id, p.partner_longitude, p.partner_latitude
+            """,
+            (self.env.uid, self.env.cr.now(), self.ids),
+        )
+        coordinates = {
+            id_: (longitude, latitude)
+            for id_, longitude, latitude in self.env.cr.fetchall()
+        }
+        for index, fname in enumerate(("partner_longitude", "partner_latitude")):
+            field = self._fields[fname]
+            self.env.cache.update(
+                self,
+                field,
+                [
+                    field.convert_to_cache(coordinates[rec.id][index], rec)
+                    for rec in self
+                ],
+            )
+        self.modified(["partner_longitude", "partner_latitude"])
+        self._invalidate_geo_caches()
+
+    def _invalidate_geo_caches(self, tile_cache_fields=()):
+        """Do what write does after the UPDATE queries that bypass it:
+        refresh the write date and drop the geo searches and the vector
+        tiles that may depend on the changes"""
+        self.invalidate_recordset(["write_uid", "write_date"], flush=False)
+        if self._geo_search_cache:
+            self._geo_search_cache_invalidate()
+        if tile_cache_fields:
+            self.env["geoengine.tile.cache"]._invalidate_records(
+                self, tile_cache_fields
+            )
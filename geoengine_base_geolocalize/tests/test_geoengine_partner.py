@@ -1,7 +1,12 @@
 # Copyright 2015-2017 ACSONE SA/NV (<http://acsone.eu>)
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl.html).
+from unittest import mock
+
+from odoo import fields
 from odoo.tests.common import TransactionCase
 
+from ..models import res_partner
+
 
 class TestGeoenginePartner(TransactionCase):
     def test_get_geo_point(self):
@@ -40,3 +45,35 @@ class TestGeoenginePartner(TransactionCase):
             self.env["res.partner"].search(domain),
             "Should not have this partner anymore",
         )
+
+    def test_geo_point_many(self):
+        partners = self.env["res.partner"].create(
+            [
+                {"name": "Located", "partner_latitude": 50.0, "partner_longitude": 5.0},
+                {"name": "Not located"},
+            ]
+        )
+        self.assertTrue(partners[0].geo_point)
+        self.assertFalse(partners[1].geo_point)
+        partners.write({"geo_point": partners[0].geo_point})
+        self.assertAlmostEqual(partners[1].partner_latitude, 50.0, 6)
+        self.assertAlmostEqual(partners[1].partner_longitude, 5.0, 6)
+
+    def test_geo_point_bulk(self):
+        vals_list = [
+            {"name": f"Partner {i}", "partner_latitude": 50.0, "partner_longitude": i}
+            for i in range(1, 5)
+        ]
+        with mock.patch.object(res_partner, "GEO_POINT_BULK_THRESHOLD", 2):
+            partners = self.env["res.partner"].create(vals_list)
+            for partner, vals in zip(partners, vals_list):
+                longitude, latitude = fields.GeoPoint.to_latlon(
+                    self.env.cr, partner.geo_point
+                )
+                self.assertAlmostEqual(longitude, vals["partner_longitude"], 6)
+                self.assertAlmostEqual(latitude, vals["partner_latitude"], 6)
+            partners.write({"geo_point": partners[0].geo_point})
+            partners.invalidate_recordset(["partner_latitude", "partner_longitude"])
+            for partner in partners:
+                self.assertAlmostEqual(partner.partner_longitude, 1.0, 6)
+                self.assertAlmostEqual(partner.partner_latitude, 50.0, 6)